@@ -0,0 +1,69 @@
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from mypysql.aio import AsyncOutputSQL
+from mypysql.spectrum import format_spectrum
+from bench_query import spectrum_description
+from standin import standin_output_sql, AsyncRecordingPool
+from synthetic import synthetic_spectrum
+
+
+def blocking_reads(reads, threads, latency_s, result_rows):
+    # OutputSQL with one connection per thread, the way a threaded web server reads today
+    def make_output_sql():
+        output_sql = standin_output_sql(latency_s=latency_s)
+        output_sql.connection.result_rows = result_rows
+        output_sql.connection.result_description = spectrum_description
+        return output_sql
+
+    output_sqls = [make_output_sql() for _ in range(threads)]
+
+    def read_many(output_sql, count):
+        for _ in range(count):
+            output_sql.query_spectrum('spectrum_bench', database='bench')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        counts = [reads // threads + (1 if i < reads % threads else 0) for i in range(threads)]
+        list(executor.map(read_many, output_sqls, counts))
+    return time.perf_counter() - start
+
+
+async def async_reads(reads, concurrency, latency_s, result_rows):
+    pool = AsyncRecordingPool(size=concurrency, latency_s=latency_s)
+    pool.result_rows = result_rows
+    pool.result_description = spectrum_description
+    output_sql = AsyncOutputSQL(verbose=False, pool=pool)
+    start = time.perf_counter()
+    await asyncio.gather(*[output_sql.query_spectrum('spectrum_bench', database='bench') for _ in range(reads)])
+    return time.perf_counter() - start, pool.max_in_flight
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent spectrum reads, threads against one event loop.")
+    parser.add_argument("--reads", type=int, default=1000)
+    parser.add_argument("--points", type=int, default=1000, help="points per spectrum read (default: 1000)")
+    parser.add_argument("--latency-ms", type=float, default=20.0,
+                        help="stand-in server time per query in ms (default: 20)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100, 500])
+    args = parser.parse_args(argv)
+    latency_s = args.latency_ms / 1000.0
+    spectrum = format_spectrum(*synthetic_spectrum(args.points, n_gaps=5, singleton_count=2,
+                                                   bandwidth_fraction_for_null=0.01),
+                               bandwidth_fraction_for_null=0.01, vectorized=True)
+    result_rows = [tuple(None if value != value else value for value in row) for row in spectrum.tolist()]
+    print(f"{args.reads} reads of {args.points} points, {args.latency_ms} ms per query")
+    print(f"{'client':<14} {'concurrency':>11} {'in flight':>10} {'seconds':>9} {'reads/s':>9}")
+    for concurrency in args.concurrency:
+        seconds = blocking_reads(args.reads, concurrency, latency_s, result_rows)
+        print(f"{'threads':<14} {concurrency:>11} {concurrency:>10} {seconds:>9.3f} {args.reads / seconds:>9.0f}")
+        seconds, max_in_flight = asyncio.run(async_reads(args.reads, concurrency, latency_s, result_rows))
+        print(f"{'asyncio':<14} {concurrency:>11} {max_in_flight:>10} {seconds:>9.3f} {args.reads / seconds:>9.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
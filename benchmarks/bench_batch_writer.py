@@ -0,0 +1,55 @@
+import sys
+import time
+import argparse
+
+from mypysql.sql import make_insert_columns_str, make_insert_values_str
+from standin import standin_output_sql
+from synthetic import synthetic_catalog, catalog_columns
+
+
+def string_buffer_insert(output_sql, rows):
+    # the string concatenation buffer that BatchWriter replaced, held in a dict like OutputSQL.buffers was
+    buffers = {0: make_insert_columns_str('object_params_float', catalog_columns, 'bench')}
+    for values in rows:
+        buffers[0] += make_insert_values_str(values) + ", "
+    output_sql.cursor.execute(buffers[0][:-2] + ";")
+    output_sql.connection.commit()
+
+
+def batch_insert(output_sql, rows, max_rows):
+    with output_sql.batch_writer('object_params_float', catalog_columns, database='bench',
+                                 max_rows=max_rows, max_bytes=2 ** 62) as writer:
+        for values in rows:
+            writer.add(values)
+    return writer.statements
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="BatchWriter throughput against the flush size.")
+    parser.add_argument("--max-exponent", type=int, default=6,
+                        help="largest catalog is 10^max_exponent rows (default: 6)")
+    parser.add_argument("--flush-rows", type=int, nargs="+", default=[100, 1000, 5000, 20000, 100000])
+    parser.add_argument("--latency-ms", type=float, default=0.5,
+                        help="stand-in round trip latency per statement in ms (default: 0.5)")
+    parser.add_argument("--string-max-exponent", type=int, default=4,
+                        help="skip the old string buffer above 10^string_max_exponent rows (default: 4)")
+    args = parser.parse_args(argv)
+    output_sql = standin_output_sql(latency_s=args.latency_ms / 1000.0)
+    print(f"{'rows':>9} {'flush rows':>11} {'statements':>11} {'seconds':>9} {'rows/s':>10}")
+    for exponent in range(3, args.max_exponent + 1):
+        rows = synthetic_catalog(10 ** exponent)
+        if exponent <= args.string_max_exponent:
+            start = time.perf_counter()
+            string_buffer_insert(output_sql, rows)
+            seconds = time.perf_counter() - start
+            print(f"{len(rows):>9} {'string':>11} {1:>11} {seconds:>9.3f} {len(rows) / seconds:>10.0f}")
+        for max_rows in args.flush_rows:
+            start = time.perf_counter()
+            statements = batch_insert(output_sql, rows, max_rows)
+            seconds = time.perf_counter() - start
+            print(f"{len(rows):>9} {max_rows:>11} {statements:>11} {seconds:>9.3f} {len(rows) / seconds:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import sys
+import time
+import argparse
+
+from mypysql.sql import OutputSQL
+from mypysql.spectrum import format_spectrum
+from standin import standin_output_sql, check_live_database
+from synthetic import synthetic_spectrum
+
+
+methods = ['executemany', 'multi_row', 'load_data']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spectrum insert throughput for each insert_spectrum_table method.")
+    parser.add_argument("--max-exponent", type=int, default=6,
+                        help="largest spectrum is 10^max_exponent points (default: 6)")
+    parser.add_argument("--live", action="store_true",
+                        help="use the MySQL server from the login (see mypysql.get_login) instead of the stand-in")
+    parser.add_argument("--database", default=None,
+                        help="a scratch database for --live (required), where bench_spectrum is made and dropped")
+    parser.add_argument("--latency-ms", type=float, default=0.5,
+                        help="stand-in round trip latency per statement in ms (default: 0.5)")
+    args = parser.parse_args(argv)
+    check_live_database(parser, args)
+    if args.live:
+        output_sql = OutputSQL(verbose=False, allow_local_infile=True)
+    else:
+        output_sql = standin_output_sql(latency_s=args.latency_ms / 1000.0)
+    print(f"{'points':>10} {'method':>12} {'seconds':>9} {'rows/s':>12}")
+    for exponent in range(4, args.max_exponent + 1):
+        spectrum = format_spectrum(*synthetic_spectrum(10 ** exponent), bandwidth_fraction_for_null=1.0e-4,
+                                   vectorized=True)
+        for method in methods:
+            start = time.perf_counter()
+            output_sql.insert_spectrum_table(table_name='bench_spectrum', columns=spectrum.dtype.names,
+                                             data=spectrum, database=args.database, method=method)
+            seconds = time.perf_counter() - start
+            print(f"{len(spectrum):>10} {method:>12} {seconds:>9.3f} {len(spectrum) / seconds:>12.0f}")
+    if args.live:
+        output_sql.drop_if_exists(table_name='bench_spectrum', database=args.database, run_silent=True)
+        output_sql.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
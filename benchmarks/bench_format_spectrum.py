@@ -0,0 +1,44 @@
+import sys
+import time
+import argparse
+
+from mypysql.spectrum import format_spectrum
+from synthetic import synthetic_spectrum
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the loop and vectorized modes of format_spectrum.")
+    parser.add_argument("--max-exponent", type=int, default=7,
+                        help="largest spectrum is 10^max_exponent points (default: 7)")
+    parser.add_argument("--loop-max-exponent", type=int, default=6,
+                        help="skip the slow loop mode above 10^loop_max_exponent points (default: 6)")
+    parser.add_argument("--gaps", type=int, default=200)
+    parser.add_argument("--bandwidth-fraction", type=float, default=1.0e-4,
+                        help="bandwidth_fraction_for_null passed to format_spectrum (default: 1e-4)")
+    args = parser.parse_args(argv)
+    print(f"{'points':>10} {'loop (s)':>10} {'vector (s)':>11} {'speedup':>8}  identical")
+    for exponent in range(4, args.max_exponent + 1):
+        n_points = 10 ** exponent
+        wavelength_um, flux, flux_error = synthetic_spectrum(n_points, n_gaps=args.gaps,
+                                                             bandwidth_fraction_for_null=args.bandwidth_fraction)
+        vector_time, vector_spectrum = time_call(format_spectrum, wavelength_um, flux, flux_error,
+                                                 bandwidth_fraction_for_null=args.bandwidth_fraction, vectorized=True)
+        if exponent <= args.loop_max_exponent:
+            loop_time, loop_spectrum = time_call(format_spectrum, wavelength_um, flux, flux_error,
+                                                 bandwidth_fraction_for_null=args.bandwidth_fraction)
+            identical = vector_spectrum.tobytes() == loop_spectrum.tobytes()
+            print(f"{n_points:>10} {loop_time:>10.4f} {vector_time:>11.4f} {loop_time / vector_time:>8.1f}  "
+                  f"{identical}")
+        else:
+            print(f"{n_points:>10} {'skipped':>10} {vector_time:>11.4f} {'':>8}  {'':>9}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+from statistics import median
+
+
+public_modules = ['mypysql.get_login', 'mypysql.get_tables', 'mypysql.instrument', 'mypysql.spectrum', 'mypysql.lod',
+                  'mypysql.bulk', 'mypysql.cache', 'mypysql.sql', 'mypysql.alchemy', 'mypysql.pool',
+                  'mypysql.ingest', 'mypysql.sync', 'mypysql.blob', 'mypysql.publish', 'mypysql.aio']
+heavy_modules = ['numpy', 'pandas', 'sqlalchemy', 'mysql.connector', 'pymysql']
+
+# run in a fresh interpreter, so every import is a cold start
+import_probe = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, [name for name in {heavy_modules!r} if name in sys.modules]]))
+"""
+
+
+def cold_import(module, repeats, env):
+    # stdin is empty, so an import that reached the login prompts fails instead of waiting
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", import_probe.format(module=module, heavy_modules=heavy_modules)],
+                                env=env, check=True, capture_output=True, text=True,
+                                stdin=subprocess.DEVNULL).stdout
+        runs.append(json.loads(output))
+    return median(seconds for seconds, _ in runs), runs[-1][1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold import time of each mypysql module, in fresh interpreters.")
+    parser.add_argument("--repeats", type=int, default=5, help="median of this many interpreters (default: 5)")
+    parser.add_argument("--modules", nargs="+", default=public_modules)
+    args = parser.parse_args(argv)
+    env = dict(os.environ)
+    repo_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([repo_dir] + [path for path in [env.get('PYTHONPATH')] if path])
+    print(f"{'module':<20} {'ms':>8}  heavy dependencies loaded")
+    for module in heavy_modules:
+        seconds, _ = cold_import(module, args.repeats, env)
+        print(f"{module:<20} {1000.0 * seconds:>8.1f}")
+    print()
+    for module in args.modules:
+        seconds, loaded = cold_import(module, args.repeats, env)
+        print(f"{module:<20} {1000.0 * seconds:>8.1f}  {', '.join(loaded) or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
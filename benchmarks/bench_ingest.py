@@ -0,0 +1,61 @@
+import sys
+import argparse
+
+from mypysql.sql import OutputSQL
+from mypysql.ingest import ingest_spectra
+from standin import standin_output_sql, check_live_database
+from synthetic import synthetic_spectrum
+
+
+def make_jobs(spectrum_count, n_points):
+    for i in range(spectrum_count):
+        wavelength_um, flux, flux_error = synthetic_spectrum(n_points, n_gaps=20, seed=i)
+        yield F"bench_spectrum_{'%05i' % i}", wavelength_um, flux, flux_error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rows/s of ingest_spectra against the connection count.")
+    parser.add_argument("--spectra", type=int, default=64)
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--processes", type=int, default=None, help="0 formats in the main thread")
+    parser.add_argument("--connections", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--method", default='load_data')
+    parser.add_argument("--latency-ms", type=float, default=1.0,
+                        help="stand-in round trip time per statement in ms (default: 1)")
+    parser.add_argument("--row-latency-us", type=float, default=20.0,
+                        help="stand-in server time per row written in microseconds (default: 20)")
+    parser.add_argument("--live", action="store_true",
+                        help="use the MySQL server from the login (see mypysql.get_login) instead of the stand-in")
+    parser.add_argument("--database", default=None,
+                        help="a scratch database for --live (required), where the bench_spectrum_* tables are made "
+                             "and dropped")
+    args = parser.parse_args(argv)
+    check_live_database(parser, args)
+    if args.live:
+        output_sql_factory = None
+    else:
+        def output_sql_factory():
+            return standin_output_sql(latency_s=args.latency_ms / 1000.0, row_latency_s=args.row_latency_us / 1.0e6)
+    print(F"{'connections':>11} {'seconds':>9} {'rows/s':>12} {'speedup':>8}")
+    base_rows_per_s = None
+    for connections in args.connections:
+        report = ingest_spectra(make_jobs(args.spectra, args.points), database=args.database,
+                                processes=args.processes, connections=connections, method=args.method,
+                                verbose=False, output_sql_factory=output_sql_factory)
+        if report.errors:
+            print(report.errors[0].error)
+        if base_rows_per_s is None:
+            base_rows_per_s = report.rows_per_s
+        print(F"{connections:>11} {report.seconds:>9.3f} {report.rows_per_s:>12.0f} "
+              F"{report.rows_per_s / base_rows_per_s:>8.2f}")
+    if args.live:
+        output_sql = OutputSQL(verbose=False)
+        for i in range(args.spectra):
+            output_sql.drop_if_exists(table_name=F"bench_spectrum_{'%05i' % i}", database=args.database,
+                                      run_silent=True)
+        output_sql.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import sys
+import time
+import argparse
+
+from mypysql.instrument import Instrumentation, phase_timer
+from standin import standin_output_sql
+from synthetic import synthetic_catalog, synthetic_spectrum, catalog_columns
+from mypysql.spectrum import format_spectrum
+
+
+def best_seconds(func, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="The cost of the instrumentation hooks, off and on.")
+    parser.add_argument("--operations", type=int, default=2000,
+                        help="insert_into_table calls per measurement (default: 2000)")
+    parser.add_argument("--spectrum-points", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=5, help="best of this many runs (default: 5)")
+    parser.add_argument("--report", action="store_true", help="print the instrumentation report at the end")
+    args = parser.parse_args(argv)
+    # no stand-in latency, so the hooks are compared against the client side work alone
+    output_sql = standin_output_sql(latency_s=0.0, commit_latency_s=0.0)
+    instrumentation = Instrumentation()
+    rows = synthetic_catalog(args.operations)
+    wavelength_um, flux, flux_error = synthetic_spectrum(args.spectrum_points)
+    spectrum = format_spectrum(wavelength_um=wavelength_um, flux=flux, flux_error=flux_error, vectorized=True)
+
+    def insert_rows():
+        for values in rows:
+            output_sql.insert_into_table('object_params_float', dict(zip(catalog_columns, values)),
+                                         database='bench')
+
+    def insert_spectrum():
+        output_sql.insert_spectrum_table('spectrum_bench', spectrum.dtype.names, spectrum, database='bench')
+
+    def null_timers():
+        for _ in range(args.operations):
+            with phase_timer(None, 'execute'):
+                pass
+
+    print(f"{'workload':<24} {'off s':>9} {'on s':>9} {'on cost':>9}")
+    for name, func in [(f"{args.operations} insert_into_table", insert_rows),
+                       (f"{args.spectrum_points} point spectrum", insert_spectrum)]:
+        output_sql.instrumentation = None
+        off_seconds = best_seconds(func, args.repeats)
+        output_sql.instrumentation = instrumentation
+        on_seconds = best_seconds(func, args.repeats)
+        output_sql.instrumentation = None
+        if func is insert_rows:
+            insert_off_seconds = off_seconds
+        print(f"{name:<24} {off_seconds:>9.4f} {on_seconds:>9.4f} {100.0 * (on_seconds / off_seconds - 1.0):>8.1f}%")
+    null_seconds = best_seconds(null_timers, args.repeats)
+    # insert_into_table goes through four hooks: the operation, serialize, execute and commit
+    print(f"a disabled hook costs {1e9 * null_seconds / args.operations:.0f} ns, " +
+          f"{100.0 * 4 * null_seconds / insert_off_seconds:.2f}% of insert_into_table with no server latency")
+    if args.report:
+        print(instrumentation.report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
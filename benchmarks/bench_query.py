@@ -0,0 +1,67 @@
+import sys
+import time
+import argparse
+import tracemalloc
+
+import pandas as pd
+
+from mypysql.spectrum import format_spectrum
+from standin import standin_output_sql
+from synthetic import synthetic_spectrum
+
+
+# (name, type_code, ...) like mysql.connector, 4 is FieldType.FLOAT
+spectrum_description = [('wavelength_um', 4, None, None, None, None, 0, 1, 63),
+                        ('flux', 4, None, None, None, None, 1, 0, 63),
+                        ('flux_error', 4, None, None, None, None, 1, 0, 63)]
+
+
+def read_list(output_sql, query_str):
+    return output_sql.query(query_str)
+
+
+def read_fetchall_dataframe(output_sql, query_str):
+    output_sql.cursor.execute(query_str)
+    rows = output_sql.cursor.fetchall()
+    return pd.DataFrame.from_records(rows, columns=[column[0] for column in output_sql.cursor.description])
+
+
+def read_array(output_sql, query_str):
+    return output_sql.query_array(query_str)
+
+
+def read_dataframe_chunks(output_sql, query_str):
+    return sum(len(df) for df in output_sql.query_dataframes(query_str))
+
+
+readers = [('list', read_list), ('fetchall->DataFrame', read_fetchall_dataframe), ('query_array', read_array),
+           ('query_dataframes', read_dataframe_chunks)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Spectrum read paths on a stand-in result of --rows rows.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args(argv)
+    spectrum = format_spectrum(*synthetic_spectrum(args.rows), bandwidth_fraction_for_null=1.0e-4, vectorized=True)
+    output_sql = standin_output_sql(latency_s=0.0)
+    # the driver hands back Python floats, with None for NULL
+    output_sql.connection.result_rows = [tuple(None if value != value else value for value in row)
+                                         for row in spectrum.tolist()]
+    output_sql.connection.result_description = spectrum_description
+    query_str = "SELECT `wavelength_um`, `flux`, `flux_error` FROM bench.`bench_spectrum` ORDER BY `wavelength_um`;"
+    print(f"{len(spectrum)} rows")
+    print(f"{'reader':>20} {'seconds':>9} {'peak MB':>9}")
+    for name, reader in readers:
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = reader(output_sql, query_str)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del result
+        print(f"{name:>20} {seconds:>9.3f} {peak / 2 ** 20:>9.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,43 @@
+import sys
+import time
+import argparse
+
+import pandas as pd
+
+from mypysql.sql import make_insert_columns_str, make_insert_values_str, make_insert_rows_str
+from synthetic import synthetic_catalog, catalog_columns
+
+
+def row_loop_insert_str(df):
+    # the per-cell isinstance chain of make_insert_values_str, one row at a time
+    insert_str = make_insert_columns_str('object_params_float', sorted(df.columns), 'bench')
+    values_strs = []
+    for row in df.to_dict(orient='records'):
+        values_strs.append(make_insert_values_str([row[column_name] for column_name in sorted(row.keys())]))
+    return insert_str + ", ".join(values_strs) + ";"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Literal SQL rendering, row loop against column-wise.")
+    parser.add_argument("--max-exponent", type=int, default=6,
+                        help="largest catalog is 10^max_exponent rows (default: 6)")
+    args = parser.parse_args(argv)
+    print(f"{'rows':>9} {'row loop (s)':>13} {'columns (s)':>12} {'speedup':>8}")
+    for exponent in range(3, args.max_exponent + 1):
+        df = pd.DataFrame(synthetic_catalog(10 ** exponent), columns=catalog_columns)
+        # float and int columns, not just the strings of object_params_float
+        df['float_value'] = df['float_value'].astype(float)
+        df['star_index'] = df.index
+        df['float_notes'] = df['float_notes'].astype(object).where(df.index % 3 != 0, "it's a note")
+        start = time.perf_counter()
+        row_loop_insert_str(df)
+        loop_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        make_insert_rows_str('object_params_float', df, 'bench')
+        column_seconds = time.perf_counter() - start
+        print(f"{len(df):>9} {loop_seconds:>13.3f} {column_seconds:>12.3f} {loop_seconds / column_seconds:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
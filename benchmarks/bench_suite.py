@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from mypysql.sql import OutputSQL, make_insert_values_str
+from mypysql.alchemy import UploadSQL
+from mypysql.spectrum import format_spectrum
+from mypysql.instrument import Instrumentation
+from mypysql.get_tables import create_tables
+from standin import standin_output_sql, standin_upload_sql, check_live_database
+from synthetic import synthetic_spectrum, synthetic_catalog, catalog_columns
+
+
+# The end to end suite: each stage runs at each size, against the recording stand-in (SQLite for UploadSQL)
+# or with --live a MySQL server. Per stage and size it reports rows/s, the latency percentiles of the calls
+# and of each instrumented phase (the statements, commits, ...), and the peak traced memory of one call.
+spectrum_sizes_default = [10000, 100000, 1000000]
+catalog_sizes_default = [1000, 10000, 100000]
+quick_spectrum_sizes = [10000]
+quick_catalog_sizes = [1000, 10000]
+percentiles = [50, 90, 99]
+suite_version = 1
+results_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'results')
+# only bench_* tables are written, the catalog table has the object_params_float columns but never its name
+spectrum_table_name = 'bench_spectrum'
+catalog_table_name = 'bench_object_params_float'
+
+
+def catalog_create_str(database):
+    create_str = create_tables['object_params_float']
+    return F"CREATE TABLE {database}.`{catalog_table_name}` " + create_str[create_str.index('('):]
+
+
+def spectrum_data(n_points):
+    return synthetic_spectrum(n_points, bandwidth_fraction_for_null=1.0e-4)
+
+
+def format_stage(n_points, vectorized):
+    wavelength_um, flux, flux_error = spectrum_data(n_points)
+
+    def run():
+        format_spectrum(wavelength_um=wavelength_um, flux=flux, flux_error=flux_error,
+                        bandwidth_fraction_for_null=1.0e-4, vectorized=vectorized)
+    return n_points, run
+
+
+def values_str_stage(n_rows):
+    rows = synthetic_catalog(n_rows)
+
+    def run():
+        for values in rows:
+            make_insert_values_str(values)
+    return n_rows, run
+
+
+def buffer_insert_stage(output_sql, database, n_rows):
+    rows = synthetic_catalog(n_rows)
+    output_sql.open_if_closed()
+    output_sql.drop_if_exists(table_name=catalog_table_name, database=database, run_silent=True)
+    output_sql.cursor.execute(catalog_create_str(database))
+
+    def run():
+        output_sql.buffer_insert_init(catalog_table_name, catalog_columns, database, run_silent=True)
+        for values in rows:
+            output_sql.buffer_insert_value(values)
+        output_sql.buffer_insert_execute(run_silent=True)
+    return n_rows, run
+
+
+def insert_spectrum_stage(output_sql, database, n_points, method):
+    spectrum = format_spectrum(*spectrum_data(n_points), bandwidth_fraction_for_null=1.0e-4, vectorized=True)
+
+    def run():
+        output_sql.insert_spectrum_table(table_name=spectrum_table_name, columns=spectrum.dtype.names, data=spectrum,
+                                         database=database, method=method)
+    return len(spectrum), run
+
+
+def upload_spectra_stage(upload_sql, schema, n_points, method):
+    wavelength_um, flux, flux_error = spectrum_data(n_points)
+
+    def run():
+        upload_sql.upload_spectra(table_name=spectrum_table_name, wavelength_um=wavelength_um, flux=flux,
+                                  flux_error=flux_error, schema=schema, bandwidth_fraction_for_null=1.0e-4,
+                                  vectorized=True, method=method)
+    return n_points, run
+
+
+def latency_stats(seconds_list):
+    seconds_array = np.asarray(seconds_list)
+    stats = {F"p{percentile}_ms": float(1000.0 * np.percentile(seconds_array, percentile))
+             for percentile in percentiles}
+    stats['max_ms'] = float(1000.0 * seconds_array.max())
+    stats['count'] = len(seconds_list)
+    return stats
+
+
+def measure(stage, size, rows, run, repeats, instrumentation, memory=True):
+    # one warm up call, repeats timed calls with the phase events collected, then one call under tracemalloc
+    run()
+    phase_seconds = {}
+
+    def collect(event):
+        if event.phase != 'total':
+            phase_seconds.setdefault(event.phase, []).append(event.seconds)
+
+    instrumentation.callbacks = [collect]
+    call_seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        call_seconds.append(time.perf_counter() - start)
+    instrumentation.callbacks = []
+    peak_bytes = None
+    if memory:
+        tracemalloc.start()
+        try:
+            run()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    best_seconds = min(call_seconds)
+    return {'stage': stage, 'size': size, 'rows': rows, 'repeats': repeats,
+            'best_seconds': best_seconds, 'rows_per_s': rows / best_seconds if best_seconds > 0.0 else None,
+            'latency': latency_stats(call_seconds),
+            'phases': {phase: latency_stats(seconds_list) for phase, seconds_list in sorted(phase_seconds.items())},
+            'peak_mb': None if peak_bytes is None else peak_bytes / 2.0 ** 20}
+
+
+def environment_info(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                stdin=subprocess.DEVNULL).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import pandas
+    import sqlalchemy
+    return {'suite_version': suite_version, 'time': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'numpy': np.__version__, 'pandas': pandas.__version__, 'sqlalchemy': sqlalchemy.__version__,
+            'backend': 'live' if args.live else 'standin', 'latency_ms': None if args.live else args.latency_ms,
+            'repeats': args.repeats}
+
+
+def print_result(result):
+    phases = " ".join(F"{phase}={stats['p50_ms']:.3f}" for phase, stats in result['phases'].items())
+    peak_mb = '-' if result['peak_mb'] is None else F"{result['peak_mb']:.1f}"
+    print(F"{result['stage']:<34} {result['size']:>9} {result['rows_per_s']:>12.0f} " +
+          F"{result['latency']['p50_ms']:>9.2f} {result['latency']['p90_ms']:>9.2f} " +
+          F"{result['latency']['p99_ms']:>9.2f} {peak_mb:>8}  {phases}")
+
+
+def compare(results, baseline_path):
+    # the throughput and median call latency of each (stage, size) relative to an earlier results file
+    with open(baseline_path) as f:
+        baseline = {(result['stage'], result['size']): result for result in json.load(f)['results']}
+    print()
+    print(F"against {baseline_path}")
+    print(F"{'stage':<34} {'size':>9} {'rows/s':>9} {'p50':>9}")
+    for result in results:
+        old = baseline.get((result['stage'], result['size']))
+        if old is None or not old['rows_per_s']:
+            continue
+        print(F"{result['stage']:<34} {result['size']:>9} {result['rows_per_s'] / old['rows_per_s']:>8.2f}x " +
+              F"{result['latency']['p50_ms'] / old['latency']['p50_ms']:>8.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End to end benchmark suite, results are written as JSON.")
+    parser.add_argument("--spectrum-sizes", type=int, nargs="+", default=None,
+                        help=F"spectrum points (default: {spectrum_sizes_default})")
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=None,
+                        help=F"catalog rows (default: {catalog_sizes_default})")
+    parser.add_argument("--quick", action="store_true", help="the smaller sizes only")
+    parser.add_argument("--repeats", type=int, default=5, help="timed calls per stage and size (default: 5)")
+    parser.add_argument("--loop-max-points", type=int, default=100000,
+                        help="largest spectrum for the per-point format_spectrum loop (default: 100000)")
+    parser.add_argument("--stages", nargs="+", default=None, help="only the stages that start with these names")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--latency-ms", type=float, default=0.5,
+                        help="stand-in round trip latency per statement in ms (default: 0.5)")
+    parser.add_argument("--live", action="store_true",
+                        help="use the MySQL server from the login (see mypysql.get_login) instead of the stand-ins")
+    parser.add_argument("--database", default=None,
+                        help="a scratch database for --live (required), where the bench_* tables are made and dropped")
+    parser.add_argument("--output", default=None, help="results file (default: results/suite-<time>.json)")
+    parser.add_argument("--compare", default=None, help="an earlier results file to compare against")
+    args = parser.parse_args(argv)
+    check_live_database(parser, args)
+    spectrum_sizes = args.spectrum_sizes or (quick_spectrum_sizes if args.quick else spectrum_sizes_default)
+    catalog_sizes = args.catalog_sizes or (quick_catalog_sizes if args.quick else catalog_sizes_default)
+    instrumentation = Instrumentation()
+    if args.live:
+        output_sql = OutputSQL(verbose=False, allow_local_infile=True, instrumentation=instrumentation)
+        upload_sql = UploadSQL(local_infile=True, verbose=False, instrumentation=instrumentation)
+        database = args.database
+        upload_methods = ['to_sql', 'multi', 'load_data']
+    else:
+        output_sql = standin_output_sql(latency_s=args.latency_ms / 1000.0)
+        output_sql.instrumentation = instrumentation
+        upload_sql = standin_upload_sql(instrumentation=instrumentation)
+        database = 'bench'
+        # SQLite has no LOAD DATA
+        upload_methods = ['to_sql', 'multi']
+    upload_schema = database if args.live else 'main'
+
+    stages = []
+    for n_points in spectrum_sizes:
+        stages.append(('format_spectrum', n_points, lambda n=n_points: format_stage(n, vectorized=True)))
+        if n_points <= args.loop_max_points:
+            stages.append(('format_spectrum_loop', n_points, lambda n=n_points: format_stage(n, vectorized=False)))
+    for n_rows in catalog_sizes:
+        stages.append(('make_insert_values_str', n_rows, lambda n=n_rows: values_str_stage(n)))
+        stages.append(('buffer_insert', n_rows, lambda n=n_rows: buffer_insert_stage(output_sql, database, n)))
+    for n_points in spectrum_sizes:
+        for method in ['executemany', 'multi_row', 'load_data']:
+            stages.append((F"insert_spectrum_table.{method}", n_points,
+                           lambda n=n_points, m=method: insert_spectrum_stage(output_sql, database, n, m)))
+        for method in upload_methods:
+            stages.append((F"upload_spectra.{method}", n_points,
+                           lambda n=n_points, m=method: upload_spectra_stage(upload_sql, upload_schema, n, m)))
+    if args.stages:
+        stages = [stage for stage in stages if any(stage[0].startswith(name) for name in args.stages)]
+
+    print(F"{'stage':<34} {'size':>9} {'rows/s':>12} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'peak MB':>8}  " +
+          "phase p50 ms")
+    results = []
+    for stage, size, make_stage in stages:
+        rows, run = make_stage()
+        result = measure(stage, size, rows, run, repeats=args.repeats, instrumentation=instrumentation,
+                         memory=not args.no_memory)
+        print_result(result)
+        results.append(result)
+    if args.live:
+        for table_name in (spectrum_table_name, catalog_table_name):
+            output_sql.drop_if_exists(table_name=table_name, database=database, run_silent=True)
+        output_sql.close()
+
+    if args.output is None:
+        os.makedirs(results_dir, exist_ok=True)
+        output_path = os.path.join(results_dir, F"suite-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    else:
+        output_path = args.output
+    with open(output_path, 'w') as f:
+        json.dump({'environment': environment_info(args), 'results': results}, f, indent=2)
+    print(F"results written to {output_path}")
+    if args.compare is not None:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+import time
+import asyncio
+
+from mysql.connector.conversion import MySQLConverter
+
+from mypysql.sql import OutputSQL
+from mypysql.get_login import get_login
+
+
+class RecordingConnection:
+    # a stand-in for a mysql.connector connection, statements are escaped the way the client library does
+    # and each round trip to the server costs latency_s plus row_latency_s for each row written, so the client
+    # side cost of each insert path is measured
+    def __init__(self, latency_s=0.0005, commit_latency_s=0.002, row_latency_s=0.0):
+        self.latency_s = latency_s
+        self.row_latency_s = row_latency_s
+        self.commit_latency_s = commit_latency_s
+        self.converter = MySQLConverter()
+        self.statements = 0
+        self.commits = 0
+        self.rollbacks = 0
+        self.bytes_sent = 0
+        self.rows_loaded = 0
+        self.rows_written = 0
+        # what a SELECT returns: cursor.description and a list of row tuples
+        self.result_description = None
+        self.result_rows = []
+
+    def cursor(self, *args, **kwargs):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        time.sleep(self.commit_latency_s)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        pass
+
+    def consume_results(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def escape_params(self, params):
+        converter = self.converter
+        return [converter.quote(converter.escape(converter.to_mysql(value) if value is not None else None))
+                for value in params]
+
+    def send(self, operation, byte_count, row_count=0):
+        self.statements += 1
+        self.bytes_sent += byte_count
+        self.rows_written += row_count
+        time.sleep(self.latency_s + row_count * self.row_latency_s)
+
+
+class RecordingCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+        self.row_index = 0
+        self.rowcount = 0
+        self.description = None
+
+    def execute(self, operation, params=None):
+        byte_count = len(operation)
+        row_count = 0
+        if params:
+            byte_count += sum(len(value) for value in self.connection.escape_params(params))
+            if operation.startswith("INSERT"):
+                row_count = operation.count("(%s")
+        if operation.startswith("SELECT"):
+            self.description = self.connection.result_description
+            self.rows = self.connection.result_rows
+            self.row_index = 0
+        if operation.startswith("LOAD DATA LOCAL INFILE"):
+            # the client reads and sends the whole file
+            file_path = operation.split("'")[1]
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            byte_count += len(data)
+            row_count = data.count(b"\n")
+            self.connection.rows_loaded += row_count
+        self.connection.send(operation, byte_count, row_count)
+
+    def executemany(self, operation, seq_params):
+        # mysql.connector rewrites INSERT ... VALUES into a single multi-row statement
+        byte_count = len(operation)
+        row_count = 0
+        for params in seq_params:
+            byte_count += sum(len(value) for value in self.connection.escape_params(params))
+            row_count += 1
+        self.connection.send(operation, byte_count, row_count)
+
+    def fetchall(self):
+        rows = self.rows[self.row_index:]
+        self.row_index = len(self.rows)
+        return rows
+
+    def fetchmany(self, size=1):
+        rows = self.rows[self.row_index:self.row_index + size]
+        self.row_index += len(rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+def standin_output_sql(latency_s=0.0005, commit_latency_s=0.002, row_latency_s=0.0):
+    output_sql = OutputSQL(auto_connect=False, verbose=False)
+    output_sql.connection = RecordingConnection(latency_s=latency_s, commit_latency_s=commit_latency_s,
+                                                row_latency_s=row_latency_s)
+    output_sql.cursor = output_sql.connection.cursor()
+    return output_sql
+
+
+class AsyncRecordingPool:
+    # a stand-in for an aiomysql pool of size connections, each statement awaits latency_s (plus row_latency_s
+    # per row written) the way a server round trip would, so many can be waited on at once
+    def __init__(self, size=20, latency_s=0.005, commit_latency_s=0.002, row_latency_s=0.0):
+        self.semaphore = asyncio.Semaphore(size)
+        self.latency_s = latency_s
+        self.commit_latency_s = commit_latency_s
+        self.row_latency_s = row_latency_s
+        self.statements = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.result_description = None
+        self.result_rows = []
+
+    def acquire(self):
+        return AsyncRecordingConnection(self)
+
+
+class AsyncRecordingConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def __aenter__(self):
+        await self.pool.semaphore.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.pool.semaphore.release()
+
+    def cursor(self):
+        return AsyncRecordingCursor(self.pool)
+
+    async def commit(self):
+        await asyncio.sleep(self.pool.commit_latency_s)
+
+
+class AsyncRecordingCursor:
+    def __init__(self, pool):
+        self.pool = pool
+        self.rows = []
+        self.description = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def send(self, row_count):
+        pool = self.pool
+        pool.statements += 1
+        pool.in_flight += 1
+        pool.max_in_flight = max(pool.max_in_flight, pool.in_flight)
+        try:
+            await asyncio.sleep(pool.latency_s + row_count * pool.row_latency_s)
+        finally:
+            pool.in_flight -= 1
+
+    async def execute(self, operation, params=None):
+        if operation.startswith("SELECT"):
+            self.description = self.pool.result_description
+            self.rows = self.pool.result_rows
+        else:
+            self.description = None
+            self.rows = []
+        await self.send(operation.count("(%s") if operation.startswith("INSERT") else 0)
+
+    async def executemany(self, operation, seq_params):
+        await self.send(len(seq_params))
+
+    async def fetchall(self):
+        return self.rows
+
+
+def standin_upload_sql(instrumentation=None):
+    # UploadSQL on an in-memory SQLite database, schema='main' for the upload methods
+    import sqlalchemy as sa
+    from mypysql.alchemy import UploadSQL
+    return UploadSQL(verbose=False, instrumentation=instrumentation, engine=sa.create_engine("sqlite://"))
+
+
+def check_live_database(parser, args):
+    # a --live run makes and drops bench_* tables, only ever in a scratch database given with --database
+    if args.live:
+        if args.database is None:
+            parser.error("--live needs --database, a scratch database for the bench_* tables")
+        if args.database == get_login().sql_database:
+            parser.error(F"--database {args.database} is the login's default database, use a scratch database")
@@ -0,0 +1,46 @@
+import numpy as np
+
+
+def synthetic_spectrum(n_points, n_gaps=200, bad_fraction=0.001, singleton_count=20,
+                       bandwidth_fraction_for_null=1.0e-4, seed=0):
+    # a sorted wavelength grid broken into n_gaps + 1 segments, with some NaN/inf values and isolated singletons.
+    # The gaps are twice the null bandwidth of format_spectrum(..., bandwidth_fraction_for_null).
+    rng = np.random.default_rng(seed)
+    base_step = 1.0e-5
+    gap_fraction = 2.0 * bandwidth_fraction_for_null
+    gap_count = n_gaps + singleton_count
+    if gap_fraction * gap_count >= 1.0:
+        raise ValueError("Too many gaps for this bandwidth_fraction_for_null.")
+    if n_points * bandwidth_fraction_for_null < 1.0:
+        raise ValueError("Too few points, every point would be a singleton for this bandwidth_fraction_for_null.")
+    gap_step = gap_fraction * n_points * base_step / (1.0 - gap_fraction * gap_count)
+    segment_edges = np.sort(rng.choice(np.arange(1, n_points - 1), size=n_gaps, replace=False))
+    wavelength_step = np.full(n_points, base_step)
+    wavelength_step[segment_edges] = gap_step
+    singletons = rng.choice(segment_edges[:-1], size=min(singleton_count, n_gaps - 1), replace=False)
+    wavelength_step[singletons + 1] = gap_step
+    wavelength_um = 1.0 + np.cumsum(wavelength_step)
+    flux = rng.normal(1.0, 0.1, n_points)
+    flux_error = np.abs(rng.normal(0.0, 0.01, n_points))
+    bad_flux = rng.random(n_points) < bad_fraction
+    flux[bad_flux] = np.nan
+    bad_error = rng.random(n_points) < bad_fraction
+    flux_error[bad_error] = np.inf
+    return wavelength_um, flux, flux_error
+
+
+catalog_columns = ['spexodisks_handle', 'float_param_type', 'float_value', 'float_error_low', 'float_error_high',
+                   'float_ref', 'float_units', 'float_notes']
+
+
+def synthetic_catalog(n_rows, seed=0):
+    # rows shaped like the object_params_float table, as tuples in catalog_columns order
+    rng = np.random.default_rng(seed)
+    values = rng.normal(5000.0, 1000.0, n_rows)
+    errors = np.abs(rng.normal(0.0, 50.0, n_rows))
+    param_types = ['teff', 'logg', 'mass', 'radius', 'dist']
+    rows = []
+    for i in range(n_rows):
+        rows.append((f"star_{i // 5}", param_types[i % 5], str(values[i]), str(-errors[i]), str(errors[i]),
+                     "2018A&A...616A...1G", "K", None))
+    return rows
@@ -0,0 +1,187 @@
+from numpy import empty, ndarray
+
+from mypysql.get_login import get_login
+from mypysql.get_tables import create_tables, dynamically_named_tables
+from mypysql.sql import insert_into_table_str, make_insert_many_columns_str, make_insert_multi_row_str, \
+    spectrum_rows, result_dtype, fill_structured, multi_row_batch_size_default, fingerprint_table_name, \
+    no_such_table_errno
+
+
+aio_pool_min_size_default = 1
+aio_pool_max_size_default = 20
+aio_insert_methods = {'executemany', 'multi_row'}
+
+
+class AsyncOutputSQL:
+    # The asyncio counterpart of OutputSQL for the read and write paths of the website. Every call borrows a
+    # connection from an aiomysql pool (made by open(), or pass pool=) for just that call, so as many calls as
+    # the pool has connections can be waiting on the server at once on one event loop.
+    # Needs aiomysql (pip install mypysql[async]) unless a pool is passed in.
+    def __init__(self, verbose=True, pool=None, min_size=aio_pool_min_size_default,
+                 max_size=aio_pool_max_size_default, cache=None):
+        self.verbose = verbose
+        self.pool = pool
+        self.owns_pool = pool is None
+        self.min_size = min_size
+        self.max_size = max_size
+        self.cache = cache
+        # from mypysql.get_login when open() makes the pool
+        self.host = None
+        self.user = None
+        self.port = None
+        self.password = None
+
+    async def open(self):
+        if self.pool is not None:
+            return
+        try:
+            import aiomysql
+        except ImportError:
+            raise ImportError("AsyncOutputSQL needs aiomysql, install it with: pip install mypysql[async]")
+        login = get_login()
+        if self.host is None:
+            self.host = login.sql_host
+        if self.user is None:
+            self.user = login.sql_user
+        if self.port is None:
+            self.port = login.sql_port
+        if self.password is None:
+            self.password = login.sql_password
+        if self.verbose:
+            print("  Opening an async connection pool to the SQL Host Server:", self.host)
+            print("  under the user:", self.user)
+        self.pool = await aiomysql.create_pool(host=self.host, port=int(self.port), user=self.user,
+                                               password=self.password, minsize=self.min_size,
+                                               maxsize=self.max_size)
+
+    async def close(self):
+        if self.pool is not None and self.owns_pool:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+            if self.verbose:
+                print("  Closed the async connection pool.")
+
+    def invalidate_cache(self, table_name, database=None):
+        if self.cache is not None:
+            if database is None:
+                database = get_login().sql_database
+            self.cache.invalidate(database, table_name)
+
+    async def execute(self, statements, commit=True):
+        # runs (sql_str, params) pairs on one pooled connection and returns the result of the last one
+        if self.pool is None:
+            await self.open()
+        async with self.pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                for sql_str, params in statements:
+                    await cursor.execute(sql_str, params)
+                result = await cursor.fetchall(), cursor.description
+            if commit:
+                await connection.commit()
+        return result
+
+    async def query(self, sql_query_str, params=None):
+        rows, _ = await self.execute([(sql_query_str, params)], commit=False)
+        return list(rows)
+
+    async def query_array(self, sql_query_str, params=None, dtypes=None):
+        # the result as a structured array, see mypysql.sql.result_dtype
+        rows, description = await self.execute([(sql_query_str, params)], commit=False)
+        structured_array = empty(len(rows), dtype=result_dtype(description, dtypes=dtypes))
+        fill_structured(structured_array, 0, rows)
+        return structured_array
+
+    async def query_spectrum(self, table_name, database=None):
+        if database is None:
+            database = get_login().sql_database
+        query_str = F"SELECT `wavelength_um`, `flux`, `flux_error` FROM {database}.`{table_name}` " + \
+                    "ORDER BY `wavelength_um`;"
+        return await self.query_array(query_str)
+
+    async def get_tables(self, database):
+        return await self.query("SELECT table_name FROM information_schema.tables WHERE table_schema = %s",
+                                (database,))
+
+    def creat_table_statements(self, table_name, database=None, dynamic_type=None):
+        if database is None:
+            database = get_login().sql_database
+        if dynamic_type is None:
+            table_str = create_tables[table_name]
+        else:
+            table_str = "CREATE TABLE `" + table_name + "` " + dynamically_named_tables[dynamic_type]
+        return [(F"DROP TABLE IF EXISTS {database}.{table_name};", None),
+                ("USE " + database + ";", None),
+                (table_str, None)]
+
+    @staticmethod
+    async def clear_fingerprints(cursor, table_name, database):
+        # see OutputSQL.clear_fingerprints
+        if table_name == fingerprint_table_name:
+            return
+        try:
+            await cursor.execute(F"DELETE FROM {database}.`{fingerprint_table_name}` WHERE `spectrum_table` = %s;",
+                                 (table_name,))
+        except Exception as err:
+            # pymysql errors, aiomysql may not be installed when a pool is passed in
+            if not err.args or err.args[0] != no_such_table_errno:
+                raise
+
+    async def creat_table(self, table_name, database=None, dynamic_type=None, run_silent=False):
+        if database is None:
+            database = get_login().sql_database
+        if self.verbose and not run_silent:
+            print("  Creating the SQL Table: '" + table_name + "' in the database: " + database)
+        if self.pool is None:
+            await self.open()
+        async with self.pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                for sql_str, params in self.creat_table_statements(table_name=table_name, database=database,
+                                                                   dynamic_type=dynamic_type):
+                    await cursor.execute(sql_str, params)
+                await self.clear_fingerprints(cursor, table_name=table_name, database=database)
+            await connection.commit()
+        self.invalidate_cache(table_name=table_name, database=database)
+
+    async def insert_into_table(self, table_name, data, database=None):
+        if database is None:
+            database = get_login().sql_database
+        await self.execute([(insert_into_table_str(table_name, data, database=database), None)])
+        self.invalidate_cache(table_name=table_name, database=database)
+
+    async def insert_spectrum_table(self, table_name, columns, data, database=None, method='executemany',
+                                    batch_size=multi_row_batch_size_default):
+        # makes the table and fills it on one connection, committed once at the end
+        if method not in aio_insert_methods:
+            raise ValueError(F"method must be one of {sorted(aio_insert_methods)}, not: {method}")
+        if database is None:
+            database = get_login().sql_database
+        if isinstance(data, ndarray):
+            data = spectrum_rows(data)
+        if self.pool is None:
+            await self.open()
+        async with self.pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                for sql_str, params in self.creat_table_statements(table_name=table_name, database=database,
+                                                                   dynamic_type='spectrum'):
+                    await cursor.execute(sql_str, params)
+                await self.clear_fingerprints(cursor, table_name=table_name, database=database)
+                if method == 'executemany':
+                    insert_str = make_insert_many_columns_str(table_name=table_name, columns=columns,
+                                                              database=database)
+                    await cursor.executemany(insert_str, data)
+                else:
+                    for start in range(0, len(data), batch_size):
+                        batch = data[start:start + batch_size]
+                        insert_str = make_insert_multi_row_str(table_name=table_name, columns=columns,
+                                                               row_count=len(batch), database=database)
+                        await cursor.execute(insert_str, [value for row in batch for value in row])
+            await connection.commit()
+        self.invalidate_cache(table_name=table_name, database=database)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
@@ -1,86 +1,177 @@
 from typing import List, Optional
 
-import numpy as np
-import pandas as pd
-import sqlalchemy as sa
+from mypysql.get_login import get_login
+from mypysql.sql import fingerprint_table_name
+from mypysql.bulk import load_data_refused_errnos, make_load_data_str, temporary_tsv
+from mypysql.lod import lod_table_name, lod_levels, lod_table_spec
+from mypysql.instrument import operation_timer, phase_timer
+# the spectrum formatting lives in mypysql.spectrum, imported here as well for the code that used it from here
+from mypysql.spectrum import is_good_num, null_val, spectrum_dtype, bandwidth_fraction_for_null_default, \
+    spectrum_chunk_size_default, remove_bad_nums, singleton_mask, format_spectrum, good_num_arrays, \
+    insert_gap_nulls, format_spectrum_vectorized, spectrum_chunks, chunked_bandwidth_um, format_spectrum_chunks
 
-from mypysql.get_login import sql_host, sql_port, sql_database, sql_user,  sql_password
 
+def make_uri_base():
+    login = get_login()
+    return f"mysql+pymysql://{login.sql_user}:{login.sql_password}@{login.sql_host}:{login.sql_port}/"
 
-uri_base = f"mysql+pymysql://{sql_user}:{sql_password}@{sql_host}:{sql_port}/"
 
+def __getattr__(name):
+    # uri_base was a module constant, it is now made from the login when asked for
+    if name == 'uri_base':
+        return make_uri_base()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def is_good_num(a_float):
-    if any((np.isnan(a_float), np.isinf(a_float))):
-        return False
-    return True
 
-
-null_val = np.nan
-
-
-bandwidth_fraction_for_null_default = 0.01
-
-
-def remove_bad_nums(wavelength_um: List[float], flux: List[float], flux_error: Optional[List[float]] = None):
-    if flux_error is None:
-        flux_error = [null_val] * len(flux)
-    for wavelength_um, flux, flux_error in zip(wavelength_um, flux, flux_error):
-        if is_good_num(flux):
-            if not is_good_num(flux_error):
-                flux_error = null_val
-            yield wavelength_um, flux, flux_error
-
-
-def singleton_mask(wavelength_um: np.array,
-                   bandwidth_for_null_um: float = bandwidth_fraction_for_null_default):
-    wavelength_um_step = np.array(wavelength_um[1:] - wavelength_um[:-1])
-    left_side_steps = np.concatenate((np.array([0.0]), wavelength_um_step), axis=0)
-    right_side_steps = np.concatenate((wavelength_um_step, np.array([0.0])), axis=0)
-    return (left_side_steps < bandwidth_for_null_um) & (right_side_steps < bandwidth_for_null_um)
-
-
-def format_spectrum(wavelength_um: List[float], flux: List[float], flux_error: Optional[List[float]] = None,
-                    bandwidth_fraction_for_null: float = bandwidth_fraction_for_null_default):
-    # replacement here to save memory in the function call
-    wavelength_um, flux, flux_error = zip(*remove_bad_nums(wavelength_um, flux, flux_error))
-    wavelength_um = np.array(wavelength_um)
-    spectrum_bandwidth_um = max(wavelength_um) - min(wavelength_um)
-    bandwidth_for_null_um = spectrum_bandwidth_um * bandwidth_fraction_for_null
-    # remove singletons, points isolated in wavelength from both neighbors by more than bandwidth_for_null_um
-    true_is_non_singleton = singleton_mask(wavelength_um, bandwidth_for_null_um)
-    wavelength_um = wavelength_um[true_is_non_singleton]
-    flux = np.array(flux)[true_is_non_singleton]
-    flux_error = np.array(flux_error)[true_is_non_singleton]
-    # for large steps in wavelength, (re)insert a null value to break up the spectrum into segments of contiguous data
-    wavelength_um_step = np.array(wavelength_um[1:] - wavelength_um[:-1])
-    insert_count = 0
-    for i, wavelength_um_step in enumerate(wavelength_um_step):
-        if wavelength_um_step > bandwidth_for_null_um:
-            insert_count += 1
-            wavelength_um_null = wavelength_um[i] + (wavelength_um_step / 2.0)
-            insert_index = i + insert_count
-            wavelength_um = np.insert(wavelength_um, insert_index, wavelength_um_null)
-            flux = np.insert(flux, insert_index, null_val)
-            flux_error = np.insert(flux_error, insert_index, null_val)
-    return np.array(list(zip(wavelength_um, flux, flux_error)),
-                    dtype=[('wavelength_um', np.float64), ('flux', np.float32), ('flux_error', np.float32)])
+upload_methods = {'to_sql', 'multi', 'load_data'}
+upload_chunksize_default = 10000
 
 
 class UploadSQL:
-    def __init__(self):
-        self.engine = sa.create_engine(uri_base)
+    def __init__(self, local_infile: bool = False, verbose: bool = True, pool=None, cache=None,
+                 instrumentation=None, engine=None):
+        # a mypysql.cache.QueryCache shared with OutputSQL has its entries for a table dropped by upload_table,
+        # a mypysql.instrument.Instrumentation times upload_table and upload_spectra,
+        # engine is an SQLAlchemy engine to use as it is (the benchmarks pass an in-memory SQLite one)
+        self.verbose = verbose
+        self.cache = cache
+        self.instrumentation = instrumentation
+        # whether the client may send LOAD DATA LOCAL INFILE, without it method='load_data' goes straight to 'multi'
+        self.local_infile = local_infile
+        import sqlalchemy as sa
+        if engine is not None:
+            self.engine = engine
+        elif pool is not None:
+            self.local_infile = bool(pool.connect_kwargs.get('allow_local_infile', False))
+            # connections come from (and go back to) a mypysql.pool.ConnectionPool shared with OutputSQL,
+            # set allow_local_infile when making the pool to use method='load_data'
+            self.engine = sa.create_engine("mysql+mysqlconnector://", creator=pool.checkout,
+                                           poolclass=sa.pool.NullPool)
+        elif local_infile:
+            self.engine = sa.create_engine(make_uri_base(), connect_args={'local_infile': True})
+        else:
+            self.engine = sa.create_engine(make_uri_base())
 
     def drop_if_exists(self, table_name):
-        self.engine.execute(f"DROP TABLE IF EXISTS {table_name}")
-
-    def upload_table(self, table_name, df, schema=sql_database):
-        df.to_sql(table_name, con=self.engine, schema=schema, if_exists='replace', index=False)
+        with self.engine.begin() as connection:
+            connection.exec_driver_sql(f"DROP TABLE IF EXISTS {table_name}")
+        self.clear_fingerprints(table_name=table_name)
+        if self.cache is not None:
+            self.cache.invalidate(get_login().sql_database, table_name)
+
+    def clear_fingerprints(self, table_name, schema=None):
+        # forgets the mypysql.sync fingerprints of a table written here, so the next sync rewrites it in full
+        import sqlalchemy as sa
+        if schema is None:
+            schema = get_login().sql_database
+        if table_name == fingerprint_table_name or \
+                not sa.inspect(self.engine).has_table(fingerprint_table_name, schema=schema):
+            return
+        with self.engine.begin() as connection:
+            connection.execute(sa.text(f"DELETE FROM {schema}.{fingerprint_table_name} "
+                                       f"WHERE spectrum_table = :table_name"), {'table_name': table_name})
+
+    def upload_table(self, table_name, df, schema=None, if_exists='replace', method='to_sql',
+                     chunksize=upload_chunksize_default):
+        # method 'to_sql' is the pandas default, 'multi' sends multi-row INSERTs of chunksize rows, and
+        # 'load_data' bulk loads with LOAD DATA LOCAL INFILE, falling back to 'multi' if the server refuses
+        if method not in upload_methods:
+            raise ValueError(f"method must be one of {sorted(upload_methods)}, not: {method}")
+        if schema is None:
+            schema = get_login().sql_database
+        with operation_timer(self.instrumentation, 'upload_table', rows=len(df)):
+            try:
+                self.upload_table_rows(table_name=table_name, df=df, schema=schema, if_exists=if_exists,
+                                       method=method, chunksize=chunksize)
+            finally:
+                # after the write has committed (or failed), so a concurrent reader cannot re-cache the old rows
+                # and a concurrent sync cannot store fingerprints of the old rows
+                self.clear_fingerprints(table_name=table_name, schema=schema)
+                if self.cache is not None:
+                    self.cache.invalidate(schema, table_name)
+
+    def upload_table_rows(self, table_name, df, schema, if_exists, method, chunksize):
+        import sqlalchemy as sa
+        if method == 'load_data':
+            if not self.local_infile:
+                if self.verbose:
+                    print("    local_infile is off, using multi-row INSERTs instead of LOAD DATA LOCAL INFILE.")
+            else:
+                try:
+                    self.load_data_table(table_name=table_name, df=df, schema=schema, if_exists=if_exists)
+                    return
+                except sa.exc.DBAPIError as err:
+                    if not err.orig.args or err.orig.args[0] not in load_data_refused_errnos:
+                        raise
+                    if self.verbose:
+                        print(f"    LOAD DATA LOCAL INFILE refused ({err.orig.args[0]}), " +
+                              "using multi-row INSERTs instead.")
+                except RuntimeError as err:
+                    # pymysql refuses on the client side, before anything is sent, when its local_infile is off
+                    if 'LOAD_LOCAL' not in str(err):
+                        raise
+                    if self.verbose:
+                        print("    LOAD DATA LOCAL INFILE refused by the client, using multi-row INSERTs instead.")
+                # the table was already made by load_data_table
+                if_exists = 'append'
+            method = 'multi'
+        # to_sql serializes, executes and commits in one call, so it is all timed as 'execute'
+        with phase_timer(self.instrumentation, 'execute', rows=len(df)):
+            if method == 'multi':
+                df.to_sql(table_name, con=self.engine, schema=schema, if_exists=if_exists, index=False,
+                          method='multi', chunksize=chunksize)
+            else:
+                df.to_sql(table_name, con=self.engine, schema=schema, if_exists=if_exists, index=False)
+
+    def load_data_table(self, table_name, df, schema=None, if_exists='replace'):
+        # the table is made from the empty head of the DataFrame, then filled from a temporary TSV file
+        if schema is None:
+            schema = get_login().sql_database
+        df.head(0).to_sql(table_name, con=self.engine, schema=schema, if_exists=if_exists, index=False)
+        with temporary_tsv(df.to_records(index=False), instrumentation=self.instrumentation) as tsv_path:
+            with phase_timer(self.instrumentation, 'execute', rows=len(df), statements=1):
+                with self.engine.begin() as connection:
+                    connection.exec_driver_sql(make_load_data_str(table_name=table_name, columns=df.columns,
+                                                                  file_path=tsv_path, database=schema))
 
     def upload_spectra(self, table_name: str, wavelength_um: List[float], flux: List[float],
-                       flux_error: Optional[List[float]] = None, schema: str = sql_database,
-                       bandwidth_fraction_for_null: float = bandwidth_fraction_for_null_default):
-        structured_array = format_spectrum(wavelength_um=wavelength_um, flux=flux, flux_error=flux_error,
-                                           bandwidth_fraction_for_null=bandwidth_fraction_for_null)
-        df = pd.DataFrame(structured_array)
-        self.upload_table(table_name=table_name, df=df, schema=schema)
+                       flux_error: Optional[List[float]] = None, schema: Optional[str] = None,
+                       bandwidth_fraction_for_null: float = bandwidth_fraction_for_null_default,
+                       vectorized: bool = False, method: str = 'to_sql', lod_factors: Optional[List[int]] = None):
+        # lod_factors also uploads the level of detail tables of mypysql.lod
+        import pandas as pd
+        with operation_timer(self.instrumentation, 'upload_spectra', rows=len(wavelength_um)):
+            with phase_timer(self.instrumentation, 'format', rows=len(wavelength_um)):
+                structured_array = format_spectrum(wavelength_um=wavelength_um, flux=flux, flux_error=flux_error,
+                                                   bandwidth_fraction_for_null=bandwidth_fraction_for_null,
+                                                   vectorized=vectorized)
+            with phase_timer(self.instrumentation, 'serialize', rows=len(structured_array)):
+                df = pd.DataFrame(structured_array)
+            self.upload_table(table_name=table_name, df=df, schema=schema, method=method)
+            if lod_factors:
+                with phase_timer(self.instrumentation, 'format', rows=len(structured_array)):
+                    levels = lod_levels(structured_array, lod_factors=lod_factors)
+                if schema is None:
+                    schema = get_login().sql_database
+                for factor, lod in levels.items():
+                    # made from lod_table_spec, as OutputSQL.insert_lod_tables does, for the column types and
+                    # the wavelength_um primary key that to_sql would not give the table
+                    lod_name = lod_table_name(table_name, factor)
+                    with self.engine.begin() as connection:
+                        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {schema}.`{lod_name}`")
+                        connection.exec_driver_sql(f"CREATE TABLE {schema}.`{lod_name}` " + lod_table_spec)
+                    self.upload_table(table_name=lod_name, df=pd.DataFrame(lod), schema=schema, if_exists='append',
+                                      method=method)
+
+    def upload_spectra_chunks(self, table_name: str, chunks, schema: Optional[str] = None,
+                              bandwidth_for_null_um: Optional[float] = None,
+                              bandwidth_fraction_for_null: float = bandwidth_fraction_for_null_default,
+                              method: str = 'to_sql'):
+        # each formatted chunk is written as it is produced, peak memory is set by the chunk size
+        import pandas as pd
+        if_exists = 'replace'
+        for structured_array in format_spectrum_chunks(chunks=chunks, bandwidth_for_null_um=bandwidth_for_null_um,
+                                                       bandwidth_fraction_for_null=bandwidth_fraction_for_null):
+            self.upload_table(table_name=table_name, df=pd.DataFrame(structured_array), schema=schema,
+                              if_exists=if_exists, method=method)
+            if_exists = 'append'
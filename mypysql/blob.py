@@ -0,0 +1,122 @@
+import zlib
+
+import numpy as np
+
+from mypysql.get_login import get_login
+from mypysql.sql import make_insert_many_columns_str
+from mypysql.spectrum import format_spectrum, bandwidth_fraction_for_null_default, spectrum_dtype
+
+
+# The spectrum is stored as a few rows of packed spectrum_dtype bytes (16 bytes per point, little-endian)
+# instead of one row per point. Each chunk row holds its wavelength range, so a window read only fetches
+# the chunks that overlap it.
+blob_dtype = np.dtype(spectrum_dtype).newbyteorder('<')
+blob_table_spec = "(`chunk_index` INT NOT NULL, " + \
+                  "`wavelength_min_um` DOUBLE NOT NULL, " + \
+                  "`wavelength_max_um` DOUBLE NOT NULL, " + \
+                  "`row_count` INT NOT NULL, " + \
+                  "`compression` VARCHAR(10) NOT NULL, " + \
+                  "`data` LONGBLOB NOT NULL, " + \
+                  "PRIMARY KEY (`chunk_index`), " + \
+                  "KEY `wavelength_range` (`wavelength_min_um`, `wavelength_max_um`)" + \
+                  ") ENGINE=InnoDB;"
+blob_columns = ['chunk_index', 'wavelength_min_um', 'wavelength_max_um', 'row_count', 'compression', 'data']
+# 1 MB per chunk uncompressed, well under the default max_allowed_packet
+blob_chunk_rows_default = 65536
+blob_compressions = {'none': (bytes, None),
+                     'zlib': (zlib.compress, zlib.decompress)}
+
+
+def pack_spectrum_chunks(spectrum, chunk_rows=blob_chunk_rows_default, compression='none'):
+    # Splits a format_spectrum array into chunk rows for a blob table:
+    # (chunk_index, wavelength_min_um, wavelength_max_um, row_count, compression, data)
+    if compression not in blob_compressions:
+        raise ValueError(F"compression must be one of {sorted(blob_compressions)}, not: {compression}")
+    compress, _ = blob_compressions[compression]
+    spectrum = np.ascontiguousarray(spectrum, dtype=blob_dtype)
+    rows = []
+    for chunk_index, start in enumerate(range(0, len(spectrum), chunk_rows)):
+        chunk = spectrum[start:start + chunk_rows]
+        rows.append((chunk_index, float(chunk['wavelength_um'][0]), float(chunk['wavelength_um'][-1]), len(chunk),
+                     compression, compress(chunk.data)))
+    return rows
+
+
+def unpack_spectrum_chunk(data, compression='none'):
+    # a read-only view of the fetched buffer when uncompressed, nothing is copied
+    if compression not in blob_compressions:
+        raise ValueError(F"Unknown blob compression: {compression}")
+    _, decompress = blob_compressions[compression]
+    if decompress is not None:
+        data = decompress(data)
+    chunk = np.frombuffer(data, dtype=blob_dtype)
+    # frombuffer is only read-only for bytes, the drivers may hand back a bytearray
+    chunk.flags.writeable = False
+    return chunk
+
+
+def insert_spectrum_blob_table(output_sql, table_name, spectrum, database=None, chunk_rows=blob_chunk_rows_default,
+                               compression='none'):
+    # (re)makes a blob table and fills it with a format_spectrum array, one statement per chunk
+    if database is None:
+        database = get_login().sql_database
+    output_sql.open_if_closed()
+    output_sql.drop_if_exists(table_name=table_name, database=database, run_silent=True)
+    output_sql.cursor.execute(F"CREATE TABLE {database}.`{table_name}` " + blob_table_spec)
+    insert_str = make_insert_many_columns_str(table_name=F"`{table_name}`", columns=blob_columns, database=database)
+    with output_sql.transaction():
+        for row in pack_spectrum_chunks(spectrum, chunk_rows=chunk_rows, compression=compression):
+            output_sql.cursor.execute(insert_str, row)
+            output_sql.commit()
+    output_sql.invalidate_cache(table_name=table_name, database=database)
+
+
+def insert_spectrum_blob(output_sql, table_name, wavelength_um, flux, flux_error=None, database=None,
+                         bandwidth_fraction_for_null=bandwidth_fraction_for_null_default,
+                         chunk_rows=blob_chunk_rows_default, compression='none'):
+    spectrum = format_spectrum(wavelength_um=wavelength_um, flux=flux, flux_error=flux_error,
+                               bandwidth_fraction_for_null=bandwidth_fraction_for_null, vectorized=True)
+    insert_spectrum_blob_table(output_sql=output_sql, table_name=table_name, spectrum=spectrum, database=database,
+                               chunk_rows=chunk_rows, compression=compression)
+
+
+def iter_spectrum_blob_chunks(output_sql, table_name, database=None, wavelength_min_um=None,
+                              wavelength_max_um=None):
+    # Yields the stored chunks in wavelength order as read-only spectrum_dtype arrays, only the chunks that
+    # overlap [wavelength_min_um, wavelength_max_um] are fetched. Chunks are not trimmed to the window.
+    if database is None:
+        database = get_login().sql_database
+    output_sql.open_if_closed()
+    query_str = F"SELECT `compression`, `data` FROM {database}.`{table_name}`"
+    params = []
+    conditions = []
+    if wavelength_min_um is not None:
+        conditions.append("`wavelength_max_um` >= %s")
+        params.append(float(wavelength_min_um))
+    if wavelength_max_um is not None:
+        conditions.append("`wavelength_min_um` <= %s")
+        params.append(float(wavelength_max_um))
+    if conditions:
+        query_str += " WHERE " + " AND ".join(conditions)
+    query_str += " ORDER BY `chunk_index`;"
+    output_sql.cursor.execute(query_str, params)
+    for compression, data in output_sql.cursor.fetchall():
+        yield unpack_spectrum_chunk(data, compression=compression)
+
+
+def query_spectrum_blob(output_sql, table_name, database=None, wavelength_min_um=None, wavelength_max_um=None):
+    # The stored spectrum, or the part of it in [wavelength_min_um, wavelength_max_um], as a spectrum_dtype array.
+    # A result inside one uncompressed chunk is a view of the fetched buffer, otherwise the chunks are joined
+    # with a single copy.
+    chunks = list(iter_spectrum_blob_chunks(output_sql=output_sql, table_name=table_name, database=database,
+                                            wavelength_min_um=wavelength_min_um,
+                                            wavelength_max_um=wavelength_max_um))
+    if not chunks:
+        return np.empty(0, dtype=blob_dtype)
+    if wavelength_min_um is not None:
+        chunks[0] = chunks[0][np.searchsorted(chunks[0]['wavelength_um'], wavelength_min_um, side='left'):]
+    if wavelength_max_um is not None:
+        chunks[-1] = chunks[-1][:np.searchsorted(chunks[-1]['wavelength_um'], wavelength_max_um, side='right')]
+    if len(chunks) == 1:
+        return chunks[0]
+    return np.concatenate(chunks)
@@ -0,0 +1,78 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+from numpy import float32, float64, isnan, isnat, ndarray, where
+from numpy import bool_ as bool_type
+
+from mypysql.instrument import phase_timer
+
+
+# server and client error codes for a refused LOAD DATA LOCAL INFILE, pymysql reports the same numbers:
+# mysql.connector.errorcode ER_NOT_ALLOWED_COMMAND, ER_CLIENT_LOCAL_FILES_DISABLED and
+# CR_LOAD_DATA_LOCAL_INFILE_REJECTED, written out so this module does not load mysql.connector
+load_data_refused_errnos = {1148, 3948, 2068}
+
+
+def make_load_data_str(table_name, columns, file_path, database):
+    # MySQL wants forward slashes in the file path, even on Windows
+    file_path = file_path.replace("\\", "/")
+    columns_str = ", ".join([F"`{column_name}`" for column_name in columns])
+    return F"LOAD DATA LOCAL INFILE '{file_path}' INTO TABLE {database}.{table_name} " + \
+        F"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({columns_str});"
+
+
+def tsv_value_str(value):
+    if value is None or (isinstance(value, (float, float32, float64)) and isnan(value)):
+        return "\\N"
+    elif isinstance(value, (bool, bool_type)):
+        return str(int(value))
+    elif isinstance(value, str):
+        return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+    return str(value)
+
+
+def tsv_lines(data):
+    # tab separated lines for LOAD DATA, NULL (and NaN) is written as \N
+    if isinstance(data, ndarray) and data.dtype.names is not None:
+        columns = []
+        for name in data.dtype.names:
+            kind = data[name].dtype.kind
+            if kind in 'fiu':
+                column = data[name].astype(str).astype(object)
+                if kind == 'f':
+                    column[isnan(data[name])] = "\\N"
+            elif kind == 'b':
+                column = where(data[name], "1", "0").astype(object)
+            elif kind == 'M':
+                column = data[name].astype('datetime64[us]').astype(str).astype(object)
+                column = [value.replace('T', ' ') for value in column]
+                column = where(isnat(data[name]), "\\N", column).astype(object)
+            else:
+                # strings, None and mixed objects need the escapes and \N of tsv_value_str
+                column = [tsv_value_str(value) for value in data[name].tolist()]
+            columns.append(column)
+        for row in zip(*columns):
+            yield "\t".join(row) + "\n"
+    else:
+        for row in data:
+            yield "\t".join([tsv_value_str(value) for value in row]) + "\n"
+
+
+def write_tsv(data, file_path):
+    with open(file_path, 'w', newline='\n') as f:
+        f.writelines(tsv_lines(data))
+
+
+@contextmanager
+def temporary_tsv(data, instrumentation=None):
+    # the file is closed before the path is handed out so the MySQL client can open it on any platform
+    with tempfile.NamedTemporaryFile(suffix='.tsv', delete=False) as f:
+        tsv_path = f.name
+    try:
+        with phase_timer(instrumentation, 'serialize', rows=len(data)) as timer:
+            write_tsv(data=data, file_path=tsv_path)
+            timer.nbytes = os.path.getsize(tsv_path)
+        yield tsv_path
+    finally:
+        os.remove(tsv_path)
@@ -0,0 +1,141 @@
+import os
+import sys
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+cache_max_bytes_default = 256 * 1024 * 1024
+
+
+def value_nbytes(value):
+    # the memory used by a cached query result, close enough for the byte limit
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return value.nbytes + sum(sys.getsizeof(item) for row in value.tolist() for item in row)
+        return value.nbytes
+    # pandas is only loaded if something else already loaded it, otherwise the value cannot be a DataFrame
+    elif 'pandas' in sys.modules and isinstance(value, sys.modules['pandas'].DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    elif isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(row) + sum(sys.getsizeof(item) for item in row)
+                                          for row in value)
+    return sys.getsizeof(value)
+
+
+def hash_str(a_str):
+    return hashlib.sha1(a_str.encode()).hexdigest()
+
+
+class QueryCache:
+    # An in-memory LRU of query results limited to max_bytes, keyed by (database, table_name, query_str).
+    # With disk_dir, NumPy arrays without object fields are also saved as .npy files and read back
+    # memory-mapped after they leave memory (or in a later process). OutputSQL and UploadSQL invalidate
+    # a table's entries when they create, drop or write to that table.
+    def __init__(self, max_bytes=cache_max_bytes_default, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        if disk_dir is not None and not os.path.isdir(disk_dir):
+            os.makedirs(disk_dir)
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()
+        self.table_keys = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def table_dir(self, database, table_name):
+        return os.path.join(self.disk_dir, hash_str(F"{database}.{table_name}"))
+
+    def disk_path(self, database, table_name, query_str):
+        return os.path.join(self.table_dir(database, table_name), hash_str(query_str) + '.npy')
+
+    def get(self, database, table_name, query_str):
+        # the cached result or None
+        key = (database, table_name, query_str)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            if self.disk_dir is not None:
+                disk_path = self.disk_path(database, table_name, query_str)
+                if os.path.isfile(disk_path):
+                    self.disk_hits += 1
+                    return np.load(disk_path, mmap_mode='r', allow_pickle=False)
+            self.misses += 1
+            return None
+
+    def put(self, database, table_name, query_str, value):
+        # Every reader gets the same object back, so it is frozen first: arrays are made read-only (like the
+        # memory-mapped disk tier) and lists become tuples. Returns the frozen value.
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+        elif isinstance(value, list):
+            value = tuple(value)
+        key = (database, table_name, query_str)
+        nbytes = value_nbytes(value)
+        with self.lock:
+            self.remove(key)
+            if nbytes <= self.max_bytes:
+                self.entries[key] = (value, nbytes)
+                self.nbytes += nbytes
+                self.table_keys.setdefault((database, table_name), set()).add(key)
+                while self.nbytes > self.max_bytes:
+                    old_key = next(iter(self.entries))
+                    self.remove(old_key)
+                    self.evictions += 1
+            if self.disk_dir is not None and isinstance(value, np.ndarray) and not value.dtype.hasobject:
+                os.makedirs(self.table_dir(database, table_name), exist_ok=True)
+                np.save(self.disk_path(database, table_name, query_str), value, allow_pickle=False)
+        return value
+
+    def remove(self, key):
+        with self.lock:
+            if key in self.entries:
+                value, nbytes = self.entries.pop(key)
+                self.nbytes -= nbytes
+                # invalidate has already taken the table's key set out of table_keys
+                self.table_keys.get(key[:2], set()).discard(key)
+
+    def invalidate(self, database, table_name):
+        with self.lock:
+            for key in list(self.table_keys.pop((database, table_name), ())):
+                self.remove(key)
+            if self.disk_dir is not None:
+                shutil.rmtree(self.table_dir(database, table_name), ignore_errors=True)
+            self.invalidations += 1
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self.remove(key)
+            self.table_keys = {}
+            if self.disk_dir is not None:
+                shutil.rmtree(self.disk_dir, ignore_errors=True)
+                os.makedirs(self.disk_dir)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
+
+
+shared_cache = None
+shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache(max_bytes=cache_max_bytes_default, disk_dir=None):
+    # the process-wide cache, the settings are used when it is first made
+    global shared_cache
+    with shared_cache_lock:
+        if shared_cache is None:
+            shared_cache = QueryCache(max_bytes=max_bytes, disk_dir=disk_dir)
+        return shared_cache
@@ -1,39 +1,98 @@
 import os
+import threading
+from collections import namedtuple
 
 
-try:
-    from mypysql.sql_config import sql_host, sql_port, sql_database, sql_user,  sql_password
-except ImportError:
-    try:
-        from sql_config import sql_host, sql_port, sql_database, sql_user,  sql_password
-    except ImportError:
+# The login is worked out on first use (the first connection, or the first call that needs the default
+# database), not on import. In order: set_login(), the MYPYSQL_* environment variables, an sql_config module
+# (mypysql.sql_config, sql_config or ref.sql_config), and last the interactive prompts.
+SQLLogin = namedtuple('SQLLogin', ['sql_host', 'sql_port', 'sql_database', 'sql_user', 'sql_password'])
+login_env_vars = {'sql_host': 'MYPYSQL_HOST', 'sql_port': 'MYPYSQL_PORT', 'sql_database': 'MYPYSQL_DATABASE',
+                  'sql_user': 'MYPYSQL_USER', 'sql_password': 'MYPYSQL_PASSWORD'}
+login_defaults = {'sql_host': 'localhost', 'sql_port': 3306}
+config_module_names = ['mypysql.sql_config', 'sql_config', 'ref.sql_config']
+
+login = None
+login_lock = threading.Lock()
+
+
+def set_login(sql_database, sql_user, sql_password, sql_host='localhost', sql_port=3306):
+    # the config object route, used in place of the environment, config files and prompts
+    global login
+    with login_lock:
+        login = SQLLogin(sql_host=sql_host, sql_port=sql_port, sql_database=sql_database, sql_user=sql_user,
+                         sql_password=sql_password)
+    return login
+
+
+def reset_login():
+    global login
+    with login_lock:
+        login = None
+
+
+def config_module_login():
+    # the values of the first sql_config module found, or {}
+    for module_name in config_module_names:
         try:
-            from ref.sql_config import sql_host, sql_port, sql_database, sql_user,  sql_password
+            config_module = __import__(module_name, fromlist=['sql_database'])
         except ImportError:
-            sql_database = input(f"MySQL Database - Enter the MySQL Database (Schema):\n")
+            continue
+        return {field: getattr(config_module, field) for field in SQLLogin._fields if hasattr(config_module, field)}
+    return {}
+
+
+def env_login():
+    return {field: os.environ[env_var] for field, env_var in login_env_vars.items() if env_var in os.environ}
+
+
+def prompt_login():
+    sql_database = input(f"MySQL Database - Enter the MySQL Database (Schema):\n")
+
+    sql_user = input(f"MySQL Username - Enter your MySQL username:\n")
+
+    sql_password = input(f"(Warning Is visible on Screen and saved in a regular text file!)\n" +
+                         f"MySQL Password - Enter your MySQL password :\n")
+
+    sql_host = input(f"MySQL Host - Enter the MySQL host URL (default: local host):\n")
+    if sql_host.strip() == "":
+        sql_host = 'localhost'
 
-            sql_user = input(f"MySQL Username - Enter your MySQL username:\n")
+    sql_port = input(f"MySQL Port - Enter the MySQL port to use (default: 3306):\n")
+    if sql_port.strip() == "":
+        sql_port = 3306
 
-            sql_password = input(f"(Warning Is visible on Screen and saved in a regular text file!)\n" +
-                                 f"MySQL Password - Enter your MySQL password :\n")
+    save_this_data = input("Save this data to be automatically imported next time? [Y,n]:\n").strip().lower()
+    if len(save_this_data) != 0 and save_this_data[0] == 'y':
+        # save the data
+        mypysql_module_dir = os.path.dirname(os.path.realpath(__file__))
+        sql_config_path = os.path.join(mypysql_module_dir, 'sql_config.py')
+        with open(sql_config_path, 'w') as f:
+            f.write(f'''sql_host = "{sql_host}"\n''')
+            f.write(f'''sql_port = "{sql_port}"\n''')
+            f.write(f'''sql_database = "{sql_database}"\n''')
+            f.write(f'''sql_user = "{sql_user}"\n''')
+            f.write(f"""sql_password = '''{sql_password}'''\n""")
+    return SQLLogin(sql_host=sql_host, sql_port=sql_port, sql_database=sql_database, sql_user=sql_user,
+                    sql_password=sql_password)
 
-            sql_host = input(f"MySQL Host - Enter the MySQL host URL (default: local host):\n")
-            if sql_host.strip() == "":
-                sql_host = 'localhost'
 
-            sql_port = input(f"MySQL Port - Enter the MySQL port to use (default: 3306):\n")
-            if sql_port.strip() == "":
-                sql_port = 3306
+def get_login():
+    global login
+    with login_lock:
+        if login is None:
+            # environment variables override single values of a config module
+            values = config_module_login()
+            values.update(env_login())
+            if all(field in values for field in ('sql_database', 'sql_user', 'sql_password')):
+                login = SQLLogin(**{field: values.get(field, login_defaults.get(field)) for field in SQLLogin._fields})
+            else:
+                login = prompt_login()
+        return login
 
-            save_this_data = input("Save this data to be automatically imported next time? [Y,n]:\n").strip().lower()
-            if len(save_this_data) != 0 and save_this_data[0] == 'y':
-                # save the data
-                mypysql_module_dir = os.path.dirname(os.path.realpath(__file__))
-                sql_config_path = os.path.join(mypysql_module_dir, 'sql_config.py')
-                with open(sql_config_path, 'w') as f:
-                    f.write(f'''sql_host = "{sql_host}"''')
-                    f.write(f'''sql_port = "{sql_port}"''')
-                    f.write(f'''sql_database = "{sql_database}"''')
-                    f.write(f'''sql_user = "{sql_user}"''')
-                    f.write(f"""sql_password = '''{sql_password}'''\n""")
 
+def __getattr__(name):
+    # from mypysql.get_login import sql_host, ... still works, the login is worked out at that import
+    if name in SQLLogin._fields:
+        return getattr(get_login(), name)
+    raise AttributeError(F"module {__name__!r} has no attribute {name!r}")
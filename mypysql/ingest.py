@@ -0,0 +1,163 @@
+import time
+import queue
+import threading
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from mypysql.sql import OutputSQL
+from mypysql.spectrum import format_spectrum, bandwidth_fraction_for_null_default
+
+
+# one result per job, error is None on success or the exception raised while formatting or writing
+IngestResult = namedtuple('IngestResult', ['table_name', 'rows', 'seconds', 'error'])
+
+
+class IngestReport:
+    def __init__(self, results, seconds):
+        self.results = results
+        self.seconds = seconds
+
+    @property
+    def rows(self):
+        return sum(result.rows for result in self.results)
+
+    @property
+    def rows_per_s(self):
+        if self.seconds <= 0.0:
+            return 0.0
+        return self.rows / self.seconds
+
+    @property
+    def errors(self):
+        return [result for result in self.results if result.error is not None]
+
+    def __str__(self):
+        return F"{len(self.results)} spectra, {self.rows} rows in {'%.3f' % self.seconds} s " + \
+               F"({'%.0f' % self.rows_per_s} rows/s), {len(self.errors)} errors"
+
+
+def format_mp_context():
+    # forkserver where the platform has it (not Windows), spawn otherwise
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def format_job(table_name, wavelength_um, flux, flux_error=None,
+               bandwidth_fraction_for_null=bandwidth_fraction_for_null_default):
+    start = time.perf_counter()
+    spectrum = format_spectrum(wavelength_um=wavelength_um, flux=flux, flux_error=flux_error,
+                               bandwidth_fraction_for_null=bandwidth_fraction_for_null, vectorized=True)
+    return table_name, spectrum, time.perf_counter() - start
+
+
+class _FinishedFuture:
+    # stands in for a concurrent.futures.Future when formatting runs in the calling thread
+    def __init__(self, func, *args, **kwargs):
+        self.error = None
+        self.value = None
+        try:
+            self.value = func(*args, **kwargs)
+        except Exception as err:
+            self.error = err
+
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def ingest_spectra(jobs, database=None, processes=None, connections=4, queue_size=None, method='executemany',
+                   bandwidth_fraction_for_null=bandwidth_fraction_for_null_default, output_sql_factory=None,
+                   pool=None, verbose=True):
+    # Create and fill many spectrum tables. jobs is an iterable of (table_name, wavelength_um, flux, flux_error)
+    # tuples, format_spectrum runs in a pool of processes (processes=0 runs it in this thread) and the tables
+    # are written by connections threads, each holding its own OutputSQL connection. At most
+    # 2 * queue_size + connections spectra are held at any time: queue_size being formatted, queue_size
+    # waiting for a writer and one being written by each writer.
+    if queue_size is None:
+        queue_size = 2 * connections
+    if output_sql_factory is None:
+        def output_sql_factory():
+            return OutputSQL(verbose=False, allow_local_infile=method == 'load_data', pool=pool)
+    results = []
+    results_lock = threading.Lock()
+    write_queue = queue.Queue(maxsize=queue_size)
+
+    def add_result(result):
+        with results_lock:
+            results.append(result)
+        if verbose:
+            if result.error is None:
+                print(F"  {result.table_name}: {result.rows} rows in {'%.3f' % result.seconds} s")
+            else:
+                print(F"  {result.table_name}: failed with {repr(result.error)}")
+
+    def writer():
+        # a writer that cannot connect keeps taking jobs off the queue and reports them as failed
+        try:
+            output_sql = output_sql_factory()
+            connect_error = None
+        except Exception as err:
+            output_sql = None
+            connect_error = err
+        try:
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    break
+                table_name, spectrum, format_seconds = item
+                if output_sql is None:
+                    add_result(IngestResult(table_name, 0, format_seconds, connect_error))
+                    continue
+                start = time.perf_counter()
+                try:
+                    output_sql.insert_spectrum_table(table_name=table_name, columns=spectrum.dtype.names,
+                                                     data=spectrum, database=database, method=method)
+                except Exception as err:
+                    add_result(IngestResult(table_name, 0, format_seconds + time.perf_counter() - start, err))
+                else:
+                    add_result(IngestResult(table_name, len(spectrum),
+                                            format_seconds + time.perf_counter() - start, None))
+        finally:
+            if output_sql is not None:
+                output_sql.close()
+
+    def hand_off(table_name, future):
+        try:
+            item = future.result()
+        except Exception as err:
+            add_result(IngestResult(table_name, 0, 0.0, err))
+        else:
+            # blocks while the writers are behind
+            write_queue.put(item)
+
+    start = time.perf_counter()
+    # the format processes are not forked, the writer threads may already be connecting (and importing)
+    # and a fork copies any lock they hold
+    format_executor = ProcessPoolExecutor(max_workers=processes, mp_context=format_mp_context()) \
+        if processes != 0 else None
+    write_executor = ThreadPoolExecutor(max_workers=connections)
+    for _ in range(connections):
+        write_executor.submit(writer)
+    try:
+        in_flight = deque()
+        for table_name, wavelength_um, flux, flux_error in jobs:
+            kwargs = dict(table_name=table_name, wavelength_um=wavelength_um, flux=flux, flux_error=flux_error,
+                          bandwidth_fraction_for_null=bandwidth_fraction_for_null)
+            if format_executor is None:
+                in_flight.append((table_name, _FinishedFuture(format_job, **kwargs)))
+            else:
+                in_flight.append((table_name, format_executor.submit(format_job, **kwargs)))
+            if len(in_flight) >= queue_size:
+                hand_off(*in_flight.popleft())
+        while in_flight:
+            hand_off(*in_flight.popleft())
+    finally:
+        for _ in range(connections):
+            write_queue.put(None)
+        write_executor.shutdown(wait=True)
+        if format_executor is not None:
+            format_executor.shutdown(wait=True)
+    return IngestReport(results=results, seconds=time.perf_counter() - start)
@@ -0,0 +1,163 @@
+import time
+import threading
+from collections import namedtuple
+
+
+# One event per timed phase of an operation. phase is one of instrument_phases or 'total' for the whole
+# operation, a phase is attributed to the innermost operation running in that thread.
+MetricEvent = namedtuple('MetricEvent', ['operation', 'phase', 'seconds', 'rows', 'bytes', 'statements'])
+instrument_phases = ('format', 'serialize', 'execute', 'commit', 'fetch')
+
+
+class PhaseStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.min_seconds = None
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.statements = 0
+
+    def add(self, event):
+        self.count += 1
+        self.seconds += event.seconds
+        if self.min_seconds is None or event.seconds < self.min_seconds:
+            self.min_seconds = event.seconds
+        if event.seconds > self.max_seconds:
+            self.max_seconds = event.seconds
+        self.rows += event.rows
+        self.bytes += event.bytes
+        self.statements += event.statements
+
+    def as_dict(self):
+        return {'count': self.count, 'seconds': self.seconds, 'min_seconds': self.min_seconds,
+                'max_seconds': self.max_seconds, 'rows': self.rows, 'bytes': self.bytes,
+                'statements': self.statements}
+
+
+class Timer:
+    # times a with block and sends the event to the instrumentation, the counts can be set inside the block
+    def __init__(self, instrumentation, operation, phase, rows=0, nbytes=0, statements=0):
+        self.instrumentation = instrumentation
+        self.operation = operation
+        self.phase = phase
+        self.rows = rows
+        self.nbytes = nbytes
+        self.statements = statements
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.instrumentation.record(MetricEvent(self.operation, self.phase, time.perf_counter() - self.start,
+                                                self.rows, self.nbytes, self.statements))
+
+
+class OperationTimer(Timer):
+    # the 'total' phase of an operation, which is the current operation of the thread inside the block
+    def __enter__(self):
+        self.instrumentation.local.__dict__.setdefault('operations', []).append(self.operation)
+        return Timer.__enter__(self)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        Timer.__exit__(self, exc_type, exc_val, exc_tb)
+        self.instrumentation.local.operations.pop()
+
+
+class NullTimer:
+    # what OutputSQL and UploadSQL time with when instrumentation is off, the counts set on it are dropped
+    rows = 0
+    nbytes = 0
+    statements = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __setattr__(self, name, value):
+        pass
+
+
+null_timer = NullTimer()
+
+
+class Instrumentation:
+    # Collects MetricEvents from OutputSQL and UploadSQL (pass instrumentation=Instrumentation()), summed per
+    # (operation, phase). Each callback is called with every MetricEvent, from the thread that made it.
+    def __init__(self, callbacks=None):
+        self.callbacks = list(callbacks or [])
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stats = {}
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def current_operation(self):
+        operations = getattr(self.local, 'operations', None)
+        if operations:
+            return operations[-1]
+        return None
+
+    def operation(self, operation, rows=0, nbytes=0):
+        return OperationTimer(self, operation, 'total', rows=rows, nbytes=nbytes)
+
+    def phase(self, phase, rows=0, nbytes=0, statements=0):
+        return Timer(self, self.current_operation(), phase, rows=rows, nbytes=nbytes, statements=statements)
+
+    def record(self, event):
+        with self.lock:
+            key = (event.operation, event.phase)
+            if key not in self.stats:
+                self.stats[key] = PhaseStats()
+            self.stats[key].add(event)
+        for callback in self.callbacks:
+            callback(event)
+
+    def summary(self):
+        # {operation: {phase: stats dict}}
+        with self.lock:
+            summary = {}
+            for (operation, phase), phase_stats in self.stats.items():
+                summary.setdefault(operation, {})[phase] = phase_stats.as_dict()
+            return summary
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    def report(self):
+        # a text table, per operation its total time and then the time in each phase
+        lines = [F"{'operation':<24} {'phase':<10} {'count':>8} {'seconds':>10} {'mean ms':>9} {'max ms':>9} " +
+                 F"{'rows':>10} {'bytes':>12} {'statements':>10}"]
+        summary = self.summary()
+        for operation in sorted(summary, key=lambda name: (name is None, name or "")):
+            phases = summary[operation]
+            for phase in ('total',) + instrument_phases:
+                if phase not in phases:
+                    continue
+                phase_stats = phases[phase]
+                mean_ms = 1000.0 * phase_stats['seconds'] / phase_stats['count']
+                lines.append(F"{str(operation):<24} {phase:<10} {phase_stats['count']:>8} " +
+                             F"{phase_stats['seconds']:>10.4f} {mean_ms:>9.3f} " +
+                             F"{1000.0 * phase_stats['max_seconds']:>9.3f} {phase_stats['rows']:>10} " +
+                             F"{phase_stats['bytes']:>12} {phase_stats['statements']:>10}")
+        return "\n".join(lines)
+
+
+def operation_timer(instrumentation, operation, rows=0, nbytes=0):
+    # the timer for a whole operation, or null_timer when instrumentation is None
+    if instrumentation is None:
+        return null_timer
+    return instrumentation.operation(operation, rows=rows, nbytes=nbytes)
+
+
+def phase_timer(instrumentation, phase, rows=0, nbytes=0, statements=0):
+    if instrumentation is None:
+        return null_timer
+    return instrumentation.phase(phase, rows=rows, nbytes=nbytes, statements=statements)
@@ -0,0 +1,77 @@
+import numpy as np
+
+
+# Level of detail tables for plotting: a spectrum table with lod_factors (16, 256, 4096) also gets the tables
+# {table_name}_lod16, ... with one row per bin of up to that many points. A bin never spans a null marker
+# of format_spectrum, the markers are kept as bins of one row with NULL flux, so plotted gaps stay gaps.
+lod_factors_default = (16, 256, 4096)
+lod_dtype = [('wavelength_um', np.float64), ('wavelength_min_um', np.float64), ('wavelength_max_um', np.float64),
+             ('flux_min', np.float32), ('flux_max', np.float32), ('flux_mean', np.float32),
+             ('flux_error_mean', np.float32), ('row_count', np.int32)]
+lod_table_spec = "(`wavelength_um` DOUBLE NOT NULL, " + \
+                 "`wavelength_min_um` DOUBLE NOT NULL, " + \
+                 "`wavelength_max_um` DOUBLE NOT NULL, " + \
+                 "`flux_min` FLOAT, " + \
+                 "`flux_max` FLOAT, " + \
+                 "`flux_mean` FLOAT, " + \
+                 "`flux_error_mean` FLOAT, " + \
+                 "`row_count` INT NOT NULL, " + \
+                 "PRIMARY KEY (`wavelength_um`)" + \
+                 ") ENGINE=InnoDB;"
+lod_columns = [name for name, _ in lod_dtype]
+
+
+def lod_table_name(table_name, factor):
+    return F"{table_name}_lod{factor}"
+
+
+def downsample_spectrum(spectrum, factor):
+    # Bins a format_spectrum array into a lod_dtype array, wavelength_um is the mean wavelength of each bin.
+    # factor=1 gives one bin per point, the full resolution spectrum in the same layout.
+    if len(spectrum) == 0:
+        return np.empty(0, dtype=lod_dtype)
+    wavelength_um = spectrum['wavelength_um'].astype(np.float64)
+    flux = spectrum['flux'].astype(np.float64)
+    flux_error = spectrum['flux_error'].astype(np.float64)
+    row_total = len(spectrum)
+    true_is_null = np.isnan(flux)
+    # runs of good points are split by the null markers, each marker is a run of its own
+    true_is_run_start = true_is_null.copy()
+    true_is_run_start[0] = True
+    true_is_run_start[1:] |= true_is_null[:-1]
+    run_starts = np.flatnonzero(true_is_run_start)
+    run_position = np.arange(row_total) - run_starts[np.cumsum(true_is_run_start) - 1]
+    bin_starts = np.flatnonzero(true_is_run_start | (run_position % factor == 0))
+    row_count = np.diff(np.append(bin_starts, row_total))
+    true_has_error = ~np.isnan(flux_error)
+    error_count = np.add.reduceat(true_has_error.astype(np.int64), bin_starts)
+    lod = np.empty(len(bin_starts), dtype=lod_dtype)
+    lod['wavelength_um'] = np.add.reduceat(wavelength_um, bin_starts) / row_count
+    lod['wavelength_min_um'] = wavelength_um[bin_starts]
+    lod['wavelength_max_um'] = wavelength_um[bin_starts + row_count - 1]
+    # null marker bins are a single NaN, so they stay NaN (NULL)
+    lod['flux_min'] = np.minimum.reduceat(flux, bin_starts)
+    lod['flux_max'] = np.maximum.reduceat(flux, bin_starts)
+    lod['flux_mean'] = np.add.reduceat(flux, bin_starts) / row_count
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lod['flux_error_mean'] = np.add.reduceat(np.where(true_has_error, flux_error, 0.0), bin_starts) / \
+            error_count
+    lod['flux_error_mean'][error_count == 0] = np.nan
+    lod['row_count'] = row_count
+    return lod
+
+
+def lod_levels(spectrum, lod_factors=lod_factors_default):
+    return {factor: downsample_spectrum(spectrum, factor) for factor in lod_factors}
+
+
+def wavelength_window_str(wavelength_min_um=None, wavelength_max_um=None):
+    # a WHERE clause (or "") for the rows in [wavelength_min_um, wavelength_max_um]
+    conditions = []
+    if wavelength_min_um is not None:
+        conditions.append(F"`wavelength_um` >= {repr(float(wavelength_min_um))}")
+    if wavelength_max_um is not None:
+        conditions.append(F"`wavelength_um` <= {repr(float(wavelength_max_um))}")
+    if conditions:
+        return " WHERE " + " AND ".join(conditions)
+    return ""
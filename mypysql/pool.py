@@ -0,0 +1,180 @@
+import os
+import time
+import weakref
+import threading
+
+from mypysql.get_login import get_login
+
+
+pool_size_default = 5
+pool_recycle_s_default = 3600.0
+pool_timeout_s_default = 30.0
+
+
+class PooledConnection:
+    # a borrowed connection that behaves like the mysql.connector connection it wraps,
+    # except that close() hands it back to the pool instead of closing it. One that is never closed
+    # (an exception before close() was reached) is handed back when it is garbage collected.
+    def __init__(self, pool, connection):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_finalizer', weakref.finalize(self, pool.release, connection))
+        self._finalizer.atexit = False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+    def close(self):
+        if self._connection is not None:
+            object.__setattr__(self, '_connection', None)
+            # runs pool.release at most once, here or at garbage collection
+            self._finalizer()
+
+
+class ConnectionPool:
+    def __init__(self, size=pool_size_default, recycle_s=pool_recycle_s_default, timeout_s=pool_timeout_s_default,
+                 ping_on_checkout=True, connect=None, **connect_kwargs):
+        # connections idle for more than recycle_s are closed and replaced at checkout, a checkout waits
+        # up to timeout_s for a connection when all size connections are in use
+        self.size = size
+        self.recycle_s = recycle_s
+        self.timeout_s = timeout_s
+        self.ping_on_checkout = ping_on_checkout
+        # mysql.connector is loaded with the first pool, not when this module is imported
+        import mysql.connector
+        self.driver_error = mysql.connector.Error
+        if connect is None:
+            connect = mysql.connector.connect
+        self.connect_func = connect
+        # the login is added to these at the first connection (see mypysql.get_login)
+        self.connect_kwargs = connect_kwargs
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        # (connection, time returned) pairs, used last in first out so the pool can shrink back to what is needed
+        self.idle = []
+        self.open_count = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.creations = 0
+        self.recycles = 0
+        self.ping_failures = 0
+        self.reset_failures = 0
+        # the default database the connections are opened on, and switched back to when they are returned
+        self.database = None
+
+    def new_connection(self):
+        login = get_login()
+        kwargs = dict(host=login.sql_host, user=login.sql_user, port=login.sql_port, password=login.sql_password,
+                      database=login.sql_database)
+        kwargs.update(self.connect_kwargs)
+        connection = self.connect_func(**kwargs)
+        with self.condition:
+            self.creations += 1
+            self.database = kwargs['database']
+        return connection
+
+    def checkout(self):
+        with self.condition:
+            waited = False
+            while not self.idle and self.open_count >= self.size:
+                if not waited:
+                    self.waits += 1
+                    waited = True
+                if not self.condition.wait(timeout=self.timeout_s):
+                    raise TimeoutError(F"No connection was returned to the pool within {self.timeout_s} seconds.")
+            if self.idle:
+                connection, returned_time = self.idle.pop()
+            else:
+                connection, returned_time = None, None
+                # reserve the slot before connecting outside of the lock
+                self.open_count += 1
+            self.checkouts += 1
+        try:
+            if connection is None:
+                connection = self.new_connection()
+            elif time.monotonic() - returned_time > self.recycle_s:
+                self.close_quietly(connection)
+                with self.condition:
+                    self.recycles += 1
+                connection = self.new_connection()
+            elif self.ping_on_checkout and not self.is_alive(connection):
+                self.close_quietly(connection)
+                with self.condition:
+                    self.ping_failures += 1
+                connection = self.new_connection()
+        except Exception:
+            with self.condition:
+                self.open_count -= 1
+                self.condition.notify()
+            raise
+        return PooledConnection(self, connection)
+
+    def release(self, connection):
+        # Anything left uncommitted is rolled back and the session is reset (user variables, temporary tables,
+        # session settings), so nothing carries over to the next borrower. The reset does not undo a USE
+        # statement, so a connection left on another database is switched back to the pool's default.
+        # A connection that fails any of this is closed rather than reused.
+        try:
+            connection.rollback()
+            connection.reset_session()
+            if connection.database != self.database:
+                connection.database = self.database
+            is_reset = True
+        except self.driver_error:
+            is_reset = False
+        if not is_reset:
+            self.close_quietly(connection)
+            with self.condition:
+                self.reset_failures += 1
+                self.open_count -= 1
+                self.condition.notify()
+            return
+        with self.condition:
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+
+    def is_alive(self, connection):
+        try:
+            connection.ping(reconnect=False)
+        except self.driver_error:
+            return False
+        return True
+
+    def close_quietly(self, connection):
+        try:
+            connection.close()
+        except self.driver_error:
+            pass
+
+    def close_all(self):
+        # closes the idle connections, borrowed connections are closed when they are returned
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.open_count -= len(idle)
+        for connection, returned_time in idle:
+            self.close_quietly(connection)
+
+    def stats(self):
+        with self.condition:
+            return {'size': self.size, 'open': self.open_count, 'idle': len(self.idle),
+                    'in_use': self.open_count - len(self.idle), 'checkouts': self.checkouts, 'waits': self.waits,
+                    'creations': self.creations, 'recycles': self.recycles, 'ping_failures': self.ping_failures,
+                    'reset_failures': self.reset_failures}
+
+
+shared_pool = None
+shared_pool_lock = threading.Lock()
+
+
+def get_shared_pool(size=pool_size_default, recycle_s=pool_recycle_s_default, timeout_s=pool_timeout_s_default,
+                    ping_on_checkout=True, **connect_kwargs):
+    # the process-wide pool, the settings are used when it is first made (or remade after a fork)
+    global shared_pool
+    with shared_pool_lock:
+        if shared_pool is None or shared_pool.pid != os.getpid():
+            shared_pool = ConnectionPool(size=size, recycle_s=recycle_s, timeout_s=timeout_s,
+                                         ping_on_checkout=ping_on_checkout, **connect_kwargs)
+        return shared_pool
@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from mypysql.sql import OutputSQL, fingerprint_table_name
+from mypysql.get_tables import update_schema_map
+
+
+old_schema_suffix_default = "_old"
+
+
+def stage_tables(loaders, staging, max_workers=4, output_sql_factory=None, verbose=True):
+    # Runs the loaders, a dict of table_name: loader(output_sql, database), in parallel with one connection per
+    # worker. Each loader creates and fills its table in the staging database. Returns table_name: error (or None).
+    if output_sql_factory is None:
+        def output_sql_factory():
+            return OutputSQL(verbose=False)
+
+    def run_loader(loader):
+        output_sql = output_sql_factory()
+        try:
+            loader(output_sql, staging)
+        finally:
+            output_sql.close()
+
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {table_name: executor.submit(run_loader, loader)
+                   for table_name, loader in loaders.items()}
+        for table_name, future in futures.items():
+            errors[table_name] = future.exception()
+            if verbose and errors[table_name] is not None:
+                print(F"  Staging {staging}.{table_name} failed with {repr(errors[table_name])}")
+    return errors
+
+
+def database_tables(output_sql, database):
+    return sorted(table_name for table_name, in output_sql.get_tables(database))
+
+
+def table_row_counts(output_sql, database, tables):
+    # exact counts, information_schema.tables.table_rows is only an estimate for InnoDB
+    return {table_name: output_sql.query(F"SELECT COUNT(*) FROM `{database}`.`{table_name}`;")[0][0]
+            for table_name in tables}
+
+
+def validate_staging(output_sql, staging, live, tables, expected_counts=None, min_row_fraction=None):
+    # Row counts in staging must equal expected_counts (table_name: count) and, with min_row_fraction, be at least
+    # that fraction of the live table's count. Raises ValueError listing every failed table.
+    staging_counts = table_row_counts(output_sql, staging, tables)
+    live_tables = set(database_tables(output_sql, live))
+    problems = []
+    if expected_counts is not None:
+        for table_name, expected_count in expected_counts.items():
+            if table_name not in staging_counts:
+                problems.append(F"{staging}.{table_name} is missing")
+            elif staging_counts[table_name] != expected_count:
+                problems.append(F"{staging}.{table_name} has {staging_counts[table_name]} rows, " +
+                                F"expected {expected_count}")
+    if min_row_fraction is not None:
+        live_counts = table_row_counts(output_sql, live, [table_name for table_name in tables
+                                                          if table_name in live_tables])
+        for table_name, live_count in live_counts.items():
+            if staging_counts[table_name] < min_row_fraction * live_count:
+                problems.append(F"{staging}.{table_name} has {staging_counts[table_name]} rows, " +
+                                F"less than {min_row_fraction} of the {live_count} in {live}.{table_name}")
+    if problems:
+        raise ValueError("Staging validation failed:\n  " + "\n  ".join(problems))
+    return staging_counts
+
+
+def make_swap_str(swaps):
+    # swaps is a list of (staging, live, old, tables, live_tables), every move is in one RENAME TABLE statement,
+    # which MySQL applies atomically, so readers see either all old tables or all new ones
+    renames = []
+    for staging, live, old, tables, live_tables in swaps:
+        for table_name in tables:
+            if table_name in live_tables:
+                renames.append(F"`{live}`.`{table_name}` TO `{old}`.`{table_name}`")
+            renames.append(F"`{staging}`.`{table_name}` TO `{live}`.`{table_name}`")
+    return "RENAME TABLE " + ", ".join(renames) + ";"
+
+
+def publish_schemas(output_sql, schema_map=None, tables=None, expected_counts=None, min_row_fraction=None,
+                    keep_old=True, old_suffix=old_schema_suffix_default):
+    # Swaps the staged tables into the live databases with one RENAME TABLE. schema_map is a list of
+    # (live, staging) pairs, by default update_schema_map, and expected_counts is live: {table_name: count}
+    # for validate_staging. The replaced live tables are moved to the database
+    # live + old_suffix, which is dropped afterwards unless keep_old. The swap only renames tables, so its
+    # time does not depend on how much data was staged.
+    if schema_map is None:
+        schema_map = update_schema_map
+    output_sql.open_if_closed()
+    # every pair is validated before anything is changed, so a failed pair leaves the live and _old
+    # databases of all the pairs as they were
+    checked = []
+    for live, staging in schema_map:
+        staging_tables = database_tables(output_sql, staging)
+        swap_tables = staging_tables if tables is None else tables
+        missing_tables = sorted(set(swap_tables) - set(staging_tables))
+        if missing_tables:
+            raise ValueError(F"Tables missing from the staging database {staging}: {missing_tables}")
+        validate_staging(output_sql, staging=staging, live=live, tables=swap_tables,
+                         expected_counts=None if expected_counts is None else expected_counts.get(live),
+                         min_row_fraction=min_row_fraction)
+        checked.append((live, staging, swap_tables))
+    swaps = []
+    for live, staging, swap_tables in checked:
+        old = live + old_suffix
+        output_sql.drop_database(database=old)
+        output_sql.creat_database(database=old)
+        swaps.append((staging, live, old, swap_tables, set(database_tables(output_sql, live))))
+    swap_str = make_swap_str(swaps)
+    output_sql.cursor.execute(swap_str)
+    for staging, live, old, swap_tables, live_tables in swaps:
+        # fingerprints swapped in with the tables are kept, the live ones no longer match the tables
+        if fingerprint_table_name not in swap_tables:
+            for table_name in swap_tables:
+                output_sql.clear_fingerprints(table_name=table_name, database=live)
+    output_sql.commit()
+    for staging, live, old, swap_tables, live_tables in swaps:
+        for table_name in swap_tables:
+            output_sql.invalidate_cache(table_name=table_name, database=live)
+        if not keep_old:
+            output_sql.drop_database(database=old)
+    return swap_str
+
+
+def publish_schema(output_sql, staging, live, tables=None, expected_counts=None, min_row_fraction=None,
+                   keep_old=True, old_suffix=old_schema_suffix_default):
+    # publish_schemas for one (live, staging) pair, expected_counts is table_name: count
+    return publish_schemas(output_sql, schema_map=[(live, staging)], tables=tables,
+                           expected_counts=None if expected_counts is None else {live: expected_counts},
+                           min_row_fraction=min_row_fraction, keep_old=keep_old, old_suffix=old_suffix)
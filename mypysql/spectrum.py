@@ -0,0 +1,208 @@
+from typing import List, Optional
+
+import numpy as np
+
+
+def is_good_num(a_float):
+    if any((np.isnan(a_float), np.isinf(a_float))):
+        return False
+    return True
+
+
+null_val = np.nan
+
+
+spectrum_dtype = [('wavelength_um', np.float64), ('flux', np.float32), ('flux_error', np.float32)]
+
+
+bandwidth_fraction_for_null_default = 0.01
+spectrum_chunk_size_default = 1000000
+
+
+def remove_bad_nums(wavelength_um: List[float], flux: List[float], flux_error: Optional[List[float]] = None):
+    if flux_error is None:
+        flux_error = [null_val] * len(flux)
+    for wavelength_um, flux, flux_error in zip(wavelength_um, flux, flux_error):
+        if is_good_num(flux):
+            if not is_good_num(flux_error):
+                flux_error = null_val
+            yield wavelength_um, flux, flux_error
+
+
+def singleton_mask(wavelength_um: np.array,
+                   bandwidth_for_null_um: float = bandwidth_fraction_for_null_default):
+    wavelength_um_step = np.array(wavelength_um[1:] - wavelength_um[:-1])
+    left_side_steps = np.concatenate((np.array([0.0]), wavelength_um_step), axis=0)
+    right_side_steps = np.concatenate((wavelength_um_step, np.array([0.0])), axis=0)
+    return (left_side_steps < bandwidth_for_null_um) & (right_side_steps < bandwidth_for_null_um)
+
+
+def format_spectrum(wavelength_um: List[float], flux: List[float], flux_error: Optional[List[float]] = None,
+                    bandwidth_fraction_for_null: float = bandwidth_fraction_for_null_default,
+                    vectorized: bool = False):
+    if vectorized:
+        return format_spectrum_vectorized(wavelength_um=wavelength_um, flux=flux, flux_error=flux_error,
+                                          bandwidth_fraction_for_null=bandwidth_fraction_for_null)
+    # replacement here to save memory in the function call
+    wavelength_um, flux, flux_error = zip(*remove_bad_nums(wavelength_um, flux, flux_error))
+    wavelength_um = np.array(wavelength_um)
+    spectrum_bandwidth_um = max(wavelength_um) - min(wavelength_um)
+    bandwidth_for_null_um = spectrum_bandwidth_um * bandwidth_fraction_for_null
+    # remove singletons, points isolated in wavelength from both neighbors by more than bandwidth_for_null_um
+    true_is_non_singleton = singleton_mask(wavelength_um, bandwidth_for_null_um)
+    wavelength_um = wavelength_um[true_is_non_singleton]
+    flux = np.array(flux)[true_is_non_singleton]
+    flux_error = np.array(flux_error)[true_is_non_singleton]
+    # for large steps in wavelength, (re)insert a null value to break up the spectrum into segments of contiguous data
+    wavelength_um_step = np.array(wavelength_um[1:] - wavelength_um[:-1])
+    insert_count = 0
+    for i, wavelength_um_step in enumerate(wavelength_um_step):
+        if wavelength_um_step > bandwidth_for_null_um:
+            insert_count += 1
+            insert_index = i + insert_count
+            # wavelength_um already holds the nulls inserted so far, the point before this gap is at insert_index - 1
+            wavelength_um_null = wavelength_um[insert_index - 1] + (wavelength_um_step / 2.0)
+            wavelength_um = np.insert(wavelength_um, insert_index, wavelength_um_null)
+            flux = np.insert(flux, insert_index, null_val)
+            flux_error = np.insert(flux_error, insert_index, null_val)
+    return np.array(list(zip(wavelength_um, flux, flux_error)), dtype=spectrum_dtype)
+
+
+def good_num_arrays(wavelength_um: List[float], flux: List[float], flux_error: Optional[List[float]] = None):
+    # array version of remove_bad_nums, the same points are kept and bad flux_error values become null_val
+    wavelength_um = np.asarray(wavelength_um)
+    flux = np.asarray(flux)
+    true_is_good_flux = np.isfinite(flux)
+    wavelength_um = wavelength_um[true_is_good_flux]
+    flux = flux[true_is_good_flux]
+    if flux_error is None:
+        flux_error = np.full(len(flux), null_val)
+    else:
+        flux_error = np.asarray(flux_error)[true_is_good_flux]
+        flux_error = np.where(np.isfinite(flux_error), flux_error, null_val)
+    return wavelength_um, flux, flux_error
+
+
+def insert_gap_nulls(wavelength_um: np.array, flux: np.array, flux_error: np.array, bandwidth_for_null_um: float):
+    # the indexes i where the step from wavelength_um[i] to wavelength_um[i + 1] is a gap
+    wavelength_um_step = wavelength_um[1:] - wavelength_um[:-1]
+    gap_indexes = np.flatnonzero(wavelength_um_step > bandwidth_for_null_um)
+    # each data point is shifted by the number of nulls inserted before it
+    data_shift = np.zeros(len(wavelength_um), dtype=np.intp)
+    data_shift[gap_indexes + 1] = 1
+    data_indexes = np.arange(len(wavelength_um)) + np.cumsum(data_shift)
+    null_indexes = gap_indexes + np.arange(1, len(gap_indexes) + 1)
+    # one allocation for the output, data and nulls are written into place
+    spectrum = np.empty(len(wavelength_um) + len(gap_indexes), dtype=spectrum_dtype)
+    spectrum['wavelength_um'][data_indexes] = wavelength_um
+    spectrum['flux'][data_indexes] = flux
+    spectrum['flux_error'][data_indexes] = flux_error
+    # cast to the input type, the same as np.insert does in format_spectrum
+    wavelength_um_null = wavelength_um[gap_indexes] + (wavelength_um_step[gap_indexes] / 2.0)
+    spectrum['wavelength_um'][null_indexes] = wavelength_um_null.astype(wavelength_um.dtype)
+    spectrum['flux'][null_indexes] = null_val
+    spectrum['flux_error'][null_indexes] = null_val
+    return spectrum
+
+
+def format_spectrum_vectorized(wavelength_um: List[float], flux: List[float], flux_error: Optional[List[float]] = None,
+                               bandwidth_fraction_for_null: float = bandwidth_fraction_for_null_default):
+    # byte-identical output to format_spectrum without the per-point Python loops and repeated np.insert copies
+    wavelength_um, flux, flux_error = good_num_arrays(wavelength_um, flux, flux_error)
+    spectrum_bandwidth_um = wavelength_um.max() - wavelength_um.min()
+    bandwidth_for_null_um = spectrum_bandwidth_um * bandwidth_fraction_for_null
+    true_is_non_singleton = singleton_mask(wavelength_um, bandwidth_for_null_um)
+    return insert_gap_nulls(wavelength_um=wavelength_um[true_is_non_singleton],
+                            flux=flux[true_is_non_singleton],
+                            flux_error=flux_error[true_is_non_singleton],
+                            bandwidth_for_null_um=bandwidth_for_null_um)
+
+
+def spectrum_chunks(wavelength_um: np.array, flux: np.array, flux_error: Optional[np.array] = None,
+                    chunk_size: int = spectrum_chunk_size_default):
+    # slices (views) of the input, for np.memmap inputs the data is only read when a chunk is formatted
+    chunks = []
+    for start in range(0, len(wavelength_um), chunk_size):
+        stop = start + chunk_size
+        if flux_error is None:
+            chunks.append((wavelength_um[start:stop], flux[start:stop], None))
+        else:
+            chunks.append((wavelength_um[start:stop], flux[start:stop], flux_error[start:stop]))
+    return chunks
+
+
+def chunked_bandwidth_um(chunks):
+    # the same spectrum_bandwidth_um as format_spectrum, found with one pass over the chunks
+    wavelength_um_min = None
+    wavelength_um_max = None
+    for wavelength_um, flux, flux_error in chunks:
+        wavelength_um = np.asarray(wavelength_um)[np.isfinite(np.asarray(flux))]
+        if len(wavelength_um) == 0:
+            continue
+        if wavelength_um_min is None:
+            wavelength_um_min = wavelength_um.min()
+            wavelength_um_max = wavelength_um.max()
+        else:
+            wavelength_um_min = min(wavelength_um_min, wavelength_um.min())
+            wavelength_um_max = max(wavelength_um_max, wavelength_um.max())
+    if wavelength_um_min is None:
+        raise ValueError("The spectrum has no points with a good (finite) flux value.")
+    return wavelength_um_max - wavelength_um_min
+
+
+def format_spectrum_chunks(chunks, bandwidth_for_null_um: Optional[float] = None,
+                           bandwidth_fraction_for_null: float = bandwidth_fraction_for_null_default):
+    # chunks is an iterable of (wavelength_um, flux, flux_error) with wavelength_um increasing across chunks.
+    # Yields spectrum_dtype arrays that concatenate to format_spectrum() of the concatenated input.
+    if bandwidth_for_null_um is None:
+        if iter(chunks) is chunks:
+            raise ValueError("A single pass iterator of chunks needs bandwidth_for_null_um, " +
+                             "use a re-iterable (like a list or spectrum_chunks() arrays) to have it calculated.")
+        bandwidth_for_null_um = chunked_bandwidth_um(chunks) * bandwidth_fraction_for_null
+    # the last point seen is held back until the next point gives the step on its right side
+    held = None
+    held_left_step = 0.0
+    # the last point written, used to find gaps that span a chunk boundary
+    last_kept = None
+    for chunk in chunks:
+        wavelength_um, flux, flux_error = good_num_arrays(*chunk)
+        if held is not None:
+            wavelength_um = np.concatenate((held[0], wavelength_um))
+            flux = np.concatenate((held[1], flux))
+            flux_error = np.concatenate((held[2], flux_error))
+        if len(wavelength_um) < 2:
+            if len(wavelength_um) == 1:
+                held = wavelength_um, flux, flux_error
+            continue
+        wavelength_um_step = wavelength_um[1:] - wavelength_um[:-1]
+        left_side_steps = np.concatenate((np.array([held_left_step]), wavelength_um_step[:-1]), axis=0)
+        true_is_non_singleton = (left_side_steps < bandwidth_for_null_um) & \
+                                (wavelength_um_step < bandwidth_for_null_um)
+        held = wavelength_um[-1:], flux[-1:], flux_error[-1:]
+        held_left_step = wavelength_um_step[-1]
+        spectrum, last_kept = _chunk_gap_nulls(wavelength_um=wavelength_um[:-1][true_is_non_singleton],
+                                               flux=flux[:-1][true_is_non_singleton],
+                                               flux_error=flux_error[:-1][true_is_non_singleton],
+                                               bandwidth_for_null_um=bandwidth_for_null_um, last_kept=last_kept)
+        if spectrum is not None:
+            yield spectrum
+    # the final point has a step of 0.0 on its right side, the same as in singleton_mask
+    if held is not None and held_left_step < bandwidth_for_null_um and 0.0 < bandwidth_for_null_um:
+        spectrum, last_kept = _chunk_gap_nulls(*held, bandwidth_for_null_um=bandwidth_for_null_um,
+                                               last_kept=last_kept)
+        yield spectrum
+
+
+def _chunk_gap_nulls(wavelength_um: np.array, flux: np.array, flux_error: np.array, bandwidth_for_null_um: float,
+                     last_kept=None):
+    if len(wavelength_um) == 0:
+        return None, last_kept
+    new_last_kept = wavelength_um[-1:], flux[-1:], flux_error[-1:]
+    if last_kept is None:
+        return insert_gap_nulls(wavelength_um, flux, flux_error, bandwidth_for_null_um), new_last_kept
+    # prepend the previously written point so a gap across the chunk boundary gets its null, then drop that point
+    spectrum = insert_gap_nulls(wavelength_um=np.concatenate((last_kept[0], wavelength_um)),
+                                flux=np.concatenate((last_kept[1], flux)),
+                                flux_error=np.concatenate((last_kept[2], flux_error)),
+                                bandwidth_for_null_um=bandwidth_for_null_um)
+    return spectrum[1:], new_last_kept
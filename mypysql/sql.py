@@ -2,13 +2,19 @@ import os
 import string
 import secrets
 from datetime import datetime
+from contextlib import contextmanager
 
-from numpy import float32, float64
-import mysql.connector
-
-from mypysql.get_login import sql_host, sql_user, sql_database, sql_password, sql_port
+from numpy import float32, float64, isnan, isfinite, ndarray, generic, full, where, cumsum, searchsorted
+from numpy import bool_ as bool_type
+from numpy import empty, equal, nan, dtype
+from mypysql.get_login import get_login
 
 from mypysql.get_tables import create_tables, dynamically_named_tables
+from mypysql.spectrum import format_spectrum_chunks, bandwidth_fraction_for_null_default, spectrum_dtype
+from mypysql.bulk import load_data_refused_errnos, make_load_data_str, temporary_tsv
+from mypysql.instrument import operation_timer, phase_timer
+from mypysql.lod import lod_dtype, lod_columns, lod_table_spec, lod_table_name, lod_levels, downsample_spectrum, \
+    wavelength_window_str, lod_factors_default
 
 
 def make_insert_columns_str(table_name, columns, database):
@@ -31,6 +37,12 @@ def make_insert_many_columns_str(table_name, columns, database=None):
     return insert_str + ")"
 
 
+def make_insert_multi_row_str(table_name, columns, row_count, database=None):
+    row_str = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    return make_insert_columns_str(table_name=table_name, columns=columns, database=database) + \
+        ", ".join([row_str] * row_count)
+
+
 def make_insert_values_str(values):
     values_str = ""
     for value in values:
@@ -49,9 +61,124 @@ def make_insert_values_str(values):
     return "(" + values_str[:-2] + ")"
 
 
+# MySQL string literal escapes, the backslash must be replaced first
+sql_str_escapes = [("\\", "\\\\"), ("'", "\\'"), ("\0", "\\0"), ("\n", "\\n"), ("\r", "\\r"),
+                   ("\x1a", "\\Z")]
+max_statement_bytes_default = 2 * 1024 * 1024
+# joins the strings of a column while they are escaped, the ASCII unit separator is not changed by escaping
+sql_strs_separator = "\x1f"
+
+
+def escape_sql_str(value):
+    for old, new in sql_str_escapes:
+        value = value.replace(old, new)
+    return value
+
+
+def escape_sql_strs(values):
+    # quoted and escaped literals for many strings, escaped as one joined string when the separator is unused
+    if len(values) == 0:
+        return []
+    joined = sql_strs_separator.join(values)
+    if joined.count(sql_strs_separator) != len(values) - 1:
+        return ["'" + escape_sql_str(value) + "'" for value in values]
+    quoted_separator = "'" + sql_strs_separator + "'"
+    return ("'" + escape_sql_str(joined).replace(sql_strs_separator, quoted_separator) + "'").split(sql_strs_separator)
+
+
+def sql_literal(value):
+    # a single value, for columns with mixed types
+    if value is None or (isinstance(value, (float, float32, float64)) and not isfinite(value)):
+        return "NULL"
+    elif isinstance(value, str):
+        return F"'{escape_sql_str(value)}'"
+    elif isinstance(value, (bool, bool_type)):
+        return str(int(value))
+    elif isinstance(value, (float, int, generic)):
+        return str(value)
+    elif isinstance(value, datetime):
+        return F"'{str(value)}'"
+    raise TypeError(F"No SQL literal for the type: {type(value)}")
+
+
+def render_sql_column(series):
+    # SQL literals for a whole pandas Series, each dtype is formatted once for the column
+    import pandas as pd
+    true_is_null = pd.isna(series).to_numpy(dtype=bool, copy=True)
+    values = series[~true_is_null] if true_is_null.any() else series
+    kind = series.dtype.kind
+    if kind == 'f':
+        values = values.to_numpy()
+        true_is_bad = ~isfinite(values)
+        if true_is_bad.any():
+            # inf has no SQL literal, it is written as NULL like NaN
+            true_is_null[where(~true_is_null)[0][true_is_bad]] = True
+            values = values[~true_is_bad]
+        if values.dtype == float64:
+            # Python's float repr is the same shortest round trip string as NumPy's, and faster
+            rendered = list(map(repr, values.tolist()))
+        else:
+            rendered = values.astype(str)
+    elif kind in 'iu':
+        rendered = values.to_numpy(dtype=values.dtype.numpy_dtype if hasattr(values.dtype, 'numpy_dtype')
+                                   else values.dtype).astype(str)
+    elif kind == 'b':
+        rendered = where(values.to_numpy(dtype=bool), "1", "0")
+    elif kind == 'M':
+        rendered = ("'" + values.dt.strftime('%Y-%m-%d %H:%M:%S.%f') + "'").to_numpy(dtype=object)
+    elif pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        rendered = escape_sql_strs(values.to_numpy(dtype=object))
+    else:
+        rendered = [sql_literal(value) for value in values]
+    if not true_is_null.any():
+        return rendered
+    column = full(len(series), "NULL", dtype=object)
+    column[~true_is_null] = rendered
+    return column
+
+
+def render_sql_rows(data):
+    # column names and one "(value, value, ...)" string per row of a DataFrame or structured array
+    if isinstance(data, ndarray):
+        import pandas as pd
+        data = pd.DataFrame(data)
+    columns = [render_sql_column(data[column_name]) for column_name in data.columns]
+    return list(data.columns), ["(" + ", ".join(row) + ")" for row in zip(*columns)]
+
+
+def make_insert_rows_str(table_name, data, database=None):
+    # a single INSERT statement with every row of a DataFrame or structured array as a SQL literal,
+    # None when there are no rows (INSERT ... VALUES; is a syntax error)
+    if database is None:
+        database = get_login().sql_database
+    columns, rows = render_sql_rows(data)
+    if not rows:
+        return None
+    return make_insert_columns_str(table_name, columns, database) + ", ".join(rows) + ";"
+
+
+def iter_insert_rows_strs(table_name, data, database=None, max_statement_bytes=max_statement_bytes_default):
+    # INSERT statements of at most max_statement_bytes (or a single row if that is larger)
+    if database is None:
+        database = get_login().sql_database
+    columns, rows = render_sql_rows(data)
+    if not rows:
+        return
+    insert_str = make_insert_columns_str(table_name, columns, database)
+    budget = max_statement_bytes - len(insert_str.encode()) - 1
+    # the end position of each row in a statement that started at the first row, with the ", " separators
+    row_ends = cumsum([len(row.encode()) + 2 for row in rows]) - 2
+    start = 0
+    while start < len(rows):
+        offset = row_ends[start - 1] + 2 if start > 0 else 0
+        stop = max(int(searchsorted(row_ends, offset + budget, side='right')), start + 1)
+        yield insert_str + ", ".join(rows[start:stop]) + ";"
+        start = stop
+
+
 def insert_into_table_str(table_name, data, database=None):
     if database is None:
-        database = sql_database
+        database = get_login().sql_database
     columns = []
     values = []
     for column_name in sorted(data.keys()):
@@ -62,29 +189,183 @@ def insert_into_table_str(table_name, data, database=None):
     return insert_str
 
 
+def spectrum_rows(spectrum):
+    # rows for cursor.executemany, with the NaN null markers of format_spectrum sent as NULL
+    columns = [spectrum[name].astype(object) for name in spectrum.dtype.names]
+    for column in columns:
+        column[isnan(column.astype(float64))] = None
+    return list(zip(*columns))
+
+
+query_batch_size_default = 50000
+spectrum_field_dtypes = dict(spectrum_dtype)
+# mysql.connector.FieldType.get_number_types(), the MySQL protocol codes that pymysql uses as well
+number_field_types = {0, 1, 2, 3, 4, 5, 8, 9, 13, 16, 246}
+
+
+def result_dtype(description, dtypes=None):
+    # a structured dtype for the columns of a query, from dtypes (a name: dtype dict), then the spectrum
+    # schema of format_spectrum, then float64 for numbers (NULL as NaN) and object for everything else
+    fields = []
+    for column in description:
+        name, type_code = column[0], column[1]
+        if dtypes is not None and name in dtypes:
+            fields.append((name, dtypes[name]))
+        elif name in spectrum_field_dtypes:
+            fields.append((name, spectrum_field_dtypes[name]))
+        elif type_code in number_field_types:
+            fields.append((name, float64))
+        else:
+            fields.append((name, object))
+    return dtype(fields)
+
+
+def fill_structured(structured_array, start, rows):
+    # writes a batch of row tuples into structured_array[start:start + len(rows)], NULL is NaN in number fields
+    stop = start + len(rows)
+    if stop == start:
+        return stop
+    # pandas turns the tuples into columns (and None into NaN for numbers) in compiled code
+    import pandas as pd
+    columns = pd.DataFrame.from_records(rows, columns=structured_array.dtype.names, coerce_float=True)
+    for name in structured_array.dtype.names:
+        if structured_array.dtype[name].kind == 'O':
+            column = columns[name].to_numpy(dtype=object, na_value=None)
+        else:
+            column = columns[name].to_numpy()
+            if structured_array.dtype[name].kind == 'f' and column.dtype == object:
+                column = where(equal(column, None), nan, column)
+        structured_array[name][start:stop] = column
+    return stop
+
+
 def generate_sql_config_file(user_name, password):
     dir_path = os.path.dirname(os.path.realpath(__file__))
     new_configs_dir = os.path.join(dir_path, 'new_configs')
     if not os.path.isdir(new_configs_dir):
         os.mkdir(new_configs_dir)
     config_file_name = os.path.join(new_configs_dir, '../sql_config.py')
+    login = get_login()
     with open(config_file_name, 'w') as f:
-        f.write(F"""sql_host = "{sql_host}"\n""")
-        f.write(F"""sql_port = "{sql_port}"\n""")
-        f.write(F"""sql_database = "{sql_database}"\n""")
+        f.write(F"""sql_host = "{login.sql_host}"\n""")
+        f.write(F"""sql_port = "{login.sql_port}"\n""")
+        f.write(F"""sql_database = "{login.sql_database}"\n""")
         f.write(F"""sql_user = "{user_name}"\n""")
         f.write(F"""sql_password = '''{password}'''\n""")
     print(F"New sql_config.py file at to: {config_file_name}")
     print(F"For user: {user_name}")
 
 
+insert_methods = {'executemany', 'multi_row', 'load_data'}
+# the block fingerprints of mypysql.sync, cleared whenever a table is dropped or rewritten another way
+fingerprint_table_name = "spectrum_fingerprint"
+# mysql.connector.errorcode.ER_NO_SUCH_TABLE
+no_such_table_errno = 1146
+multi_row_batch_size_default = 1000
+# BatchWriter flush limits, the byte limit stays well under the smallest default max_allowed_packet (4 MB)
+batch_max_rows_default = 5000
+batch_max_bytes_default = 2 * 1024 * 1024
+
+
+def estimate_row_bytes(values):
+    # rough size of the row in the rendered statement: quoted strings, 24 characters for a number
+    row_bytes = 2
+    for value in values:
+        if isinstance(value, str):
+            row_bytes += len(value) + 4
+        else:
+            row_bytes += 24
+    return row_bytes
+
+
+class BatchWriter:
+    # Holds rows as parameter tuples and writes them with parameterized multi-row INSERTs, flushing
+    # whenever max_rows rows or about max_bytes of statement are held. Used as a context manager
+    # the remaining rows are flushed on a clean exit.
+    def __init__(self, output_sql, table_name, columns, database=None, max_rows=batch_max_rows_default,
+                 max_bytes=batch_max_bytes_default):
+        if database is None:
+            database = get_login().sql_database
+        self.output_sql = output_sql
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.database = database
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.row_count = 0
+        self.params = []
+        self.byte_count = 0
+        self.statements = 0
+        self.rows_written = 0
+        self.full_insert_str = None
+
+    def add(self, values):
+        if len(values) != len(self.columns):
+            raise ValueError(F"Expected {len(self.columns)} values for {self.columns}, got {len(values)}.")
+        # mysql.connector does not convert NumPy scalars
+        values = [value.item() if isinstance(value, generic) else value for value in values]
+        self.params.extend(values)
+        self.row_count += 1
+        self.byte_count += estimate_row_bytes(values)
+        if self.row_count >= self.max_rows or self.byte_count >= self.max_bytes:
+            self.flush()
+
+    def add_many(self, rows):
+        for values in rows:
+            self.add(values)
+
+    def flush(self):
+        row_count = self.row_count
+        if row_count == 0:
+            return
+        if row_count == self.max_rows:
+            if self.full_insert_str is None:
+                self.full_insert_str = make_insert_multi_row_str(table_name=self.table_name, columns=self.columns,
+                                                                 row_count=row_count, database=self.database)
+            insert_str = self.full_insert_str
+        else:
+            insert_str = make_insert_multi_row_str(table_name=self.table_name, columns=self.columns,
+                                                   row_count=row_count, database=self.database)
+        self.output_sql.open_if_closed()
+        instrumentation = self.output_sql.instrumentation
+        with operation_timer(instrumentation, 'buffer_insert', rows=row_count, nbytes=self.byte_count):
+            with phase_timer(instrumentation, 'execute', rows=row_count, nbytes=self.byte_count, statements=1):
+                self.output_sql.cursor.execute(insert_str, self.params)
+            self.output_sql.commit()
+        self.output_sql.invalidate_cache(table_name=self.table_name, database=self.database)
+        self.statements += 1
+        self.rows_written += row_count
+        self.row_count = 0
+        self.params = []
+        self.byte_count = 0
+
+    def __len__(self):
+        return self.row_count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+
 class OutputSQL:
-    def __init__(self, auto_connect=True, verbose=True):
+    def __init__(self, auto_connect=True, verbose=True, allow_local_infile=False, pool=None, cache=None,
+                 instrumentation=None):
+        # with a pool (see mypysql.pool.get_shared_pool) open() borrows a connection and close() returns it,
+        # with a cache (see mypysql.cache.get_shared_cache) the cached_query methods read through it,
+        # with instrumentation (see mypysql.instrument.Instrumentation) the operations are timed
         self.verbose = verbose
-        self.host = sql_host
-        self.user = sql_user
-        self.port = sql_port
-        self.password = sql_password
+        self.pool = pool
+        self.cache = cache
+        self.instrumentation = instrumentation
+        # from mypysql.get_login at the first open()
+        self.host = None
+        self.user = None
+        self.port = None
+        self.password = None
+        self.allow_local_infile = allow_local_infile
         if auto_connect:
             self.open()
         else:
@@ -92,20 +373,52 @@ class OutputSQL:
             self.cursor = None
         self.buffers = {}
         self.next_user_table_number = 1
+        # set inside a transaction() scope, where commit() only counts statements
+        self.in_transaction = False
+        self.commit_every = None
+        self.uncommitted_count = 0
+        self.commit_count = 0
+        # (database, table_name) written inside the transaction() scope, invalidated when it ends
+        self.scope_invalidations = set()
+
+    def resolve_login(self):
+        login = get_login()
+        if self.host is None:
+            self.host = login.sql_host
+        if self.user is None:
+            self.user = login.sql_user
+        if self.port is None:
+            self.port = login.sql_port
+        if self.password is None:
+            self.password = login.sql_password
 
     def open(self):
+        self.resolve_login()
+        if self.pool is not None:
+            self.connection = self.pool.checkout()
+            self.cursor = self.connection.cursor()
+            return
+        import mysql.connector
         if self.verbose:
-            print("  Opening connection to the SQL Host Server:", sql_host)
-            print("  under the user:", sql_user)
+            print("  Opening connection to the SQL Host Server:", self.host)
+            print("  under the user:", self.user)
         self.connection = mysql.connector.connect(host=self.host,
                                                   user=self.user,
                                                   port=self.port,
-                                                  password=self.password)
+                                                  password=self.password,
+                                                  allow_local_infile=self.allow_local_infile)
         self.cursor = self.connection.cursor()
         if self.verbose:
             print("    Connection established")
 
     def close(self):
+        if self.pool is not None:
+            # returns the connection to the pool
+            self.cursor.close()
+            self.connection.close()
+            self.connection = None
+            self.cursor = None
+            return
         if self.verbose:
             print("  Closing SQL connection SQL Server.")
         self.cursor.close()
@@ -119,6 +432,66 @@ class OutputSQL:
         if self.connection is None:
             self.open()
 
+    def invalidate_cache(self, table_name, database=None):
+        # call after the write is committed, inside a transaction() scope this waits for the end of the scope
+        # so that rows which may still be rolled back are not left cached
+        if self.cache is not None:
+            if database is None:
+                database = get_login().sql_database
+            if self.in_transaction:
+                self.scope_invalidations.add((database, table_name))
+            else:
+                self.cache.invalidate(database, table_name)
+
+    def invalidate_scope_tables(self):
+        scope_invalidations, self.scope_invalidations = self.scope_invalidations, set()
+        for database, table_name in scope_invalidations:
+            self.cache.invalidate(database, table_name)
+
+    def commit(self):
+        # the write methods call this after each statement, inside a transaction() scope the commit
+        # is deferred to every commit_every statements (if set) and the end of the scope
+        if self.in_transaction:
+            self.uncommitted_count += 1
+            if self.commit_every is None or self.uncommitted_count < self.commit_every:
+                return
+        with phase_timer(self.instrumentation, 'commit'):
+            self.connection.commit()
+        self.commit_count += 1
+        self.uncommitted_count = 0
+
+    @contextmanager
+    def transaction(self, commit_every=None):
+        # Commits at the end of the scope and rolls back on an exception. Note that MySQL commits implicitly
+        # on DDL, so tables made or dropped inside the scope (creat_table) are not rolled back.
+        if self.in_transaction:
+            # nested scopes join the outer one
+            yield self
+            return
+        self.open_if_closed()
+        self.in_transaction = True
+        self.commit_every = commit_every
+        self.uncommitted_count = 0
+        self.scope_invalidations = set()
+        try:
+            yield self
+        except BaseException:
+            try:
+                self.connection.rollback()
+            finally:
+                # anything read inside the scope may have cached the rolled back rows
+                self.invalidate_scope_tables()
+            raise
+        else:
+            with phase_timer(self.instrumentation, 'commit'):
+                self.connection.commit()
+            self.commit_count += 1
+            self.invalidate_scope_tables()
+        finally:
+            self.in_transaction = False
+            self.commit_every = None
+            self.uncommitted_count = 0
+
     def new_user(self, user_name, password=None):
         if password is None:
             alphabet = string.ascii_letters + string.digits
@@ -167,52 +540,170 @@ class OutputSQL:
         if self.verbose and not run_silent:
             print("    Dropping (deleting if the table exists) the Table:", table_name)
         if database is None:
-            database = sql_database
+            database = get_login().sql_database
+        # the DROP commits the DELETE of the fingerprints along with it
+        self.clear_fingerprints(table_name=table_name, database=database)
         self.cursor.execute(F"DROP TABLE IF EXISTS {database}.{table_name};")
+        self.invalidate_cache(table_name=table_name, database=database)
+
+    def clear_fingerprints(self, table_name, database=None):
+        # forgets the mypysql.sync fingerprints of a table, so the next sync rewrites it in full
+        # instead of skipping blocks that no longer match the table
+        if table_name == fingerprint_table_name:
+            return
+        if database is None:
+            database = get_login().sql_database
+        import mysql.connector
+        try:
+            self.cursor.execute(F"DELETE FROM {database}.`{fingerprint_table_name}` WHERE `spectrum_table` = %s;",
+                                (table_name,))
+        except mysql.connector.Error as err:
+            # nothing was ever synced in this database
+            if err.errno != no_such_table_errno:
+                raise
 
     def creat_table(self, table_name, database=None, dynamic_type=None, run_silent=False):
         if database is None:
-            database = sql_database
+            database = get_login().sql_database
         self.open_if_closed()
-        self.drop_if_exists(table_name=table_name, database=database, run_silent=run_silent)
-        if self.verbose and not run_silent:
-            print("  Creating the SQL Table: '" + table_name + "' in the database: " + database)
-        self.cursor.execute("USE " + database + ";")
-        if dynamic_type is None:
-            table_str = create_tables[table_name]
-        else:
-            table_str = "CREATE TABLE `" + table_name + "` " + dynamically_named_tables[dynamic_type]
-        self.cursor.execute(table_str)
+        with operation_timer(self.instrumentation, 'creat_table'):
+            self.drop_if_exists(table_name=table_name, database=database, run_silent=run_silent)
+            if self.verbose and not run_silent:
+                print("  Creating the SQL Table: '" + table_name + "' in the database: " + database)
+            # the table name is qualified with the database rather than switching to it with USE, so a pooled
+            # connection goes back to the pool still on its default database
+            unqualified_str = "CREATE TABLE `" + table_name + "` "
+            if dynamic_type is None:
+                table_str = create_tables[table_name]
+            else:
+                table_str = unqualified_str + dynamically_named_tables[dynamic_type]
+            with phase_timer(self.instrumentation, 'execute', statements=1):
+                if table_str.startswith(unqualified_str):
+                    self.cursor.execute(F"CREATE TABLE {database}.`{table_name}` " +
+                                        table_str[len(unqualified_str):])
+                else:
+                    self.cursor.execute("USE " + database + ";")
+                    self.cursor.execute(table_str)
 
     def insert_into_table(self, table_name, data, database=None):
         if database is None:
-            database = sql_database
+            database = get_login().sql_database
         self.open_if_closed()
-        insert_str = insert_into_table_str(table_name, data, database=database)
-        self.cursor.execute(insert_str)
-        self.connection.commit()
-
-    def buffer_insert_init(self, table_name, columns, database, run_silent=False, buffer_num=0):
+        with operation_timer(self.instrumentation, 'insert_into_table', rows=1) as timer:
+            with phase_timer(self.instrumentation, 'serialize', rows=1):
+                insert_str = insert_into_table_str(table_name, data, database=database)
+            timer.nbytes = len(insert_str)
+            with phase_timer(self.instrumentation, 'execute', rows=1, nbytes=len(insert_str), statements=1):
+                self.cursor.execute(insert_str)
+            self.commit()
+        self.invalidate_cache(table_name=table_name, database=database)
+
+    def batch_writer(self, table_name, columns, database=None, max_rows=batch_max_rows_default,
+                     max_bytes=batch_max_bytes_default):
+        return BatchWriter(output_sql=self, table_name=table_name, columns=columns, database=database,
+                           max_rows=max_rows, max_bytes=max_bytes)
+
+    def buffer_insert_init(self, table_name, columns, database, run_silent=False, buffer_num=0,
+                           max_rows=batch_max_rows_default, max_bytes=batch_max_bytes_default):
         if self.verbose and not run_silent:
             print("  Buffer inserting " + database + "." + table_name)
-        self.buffers[buffer_num] = make_insert_columns_str(table_name, columns, database)
+        self.buffers[buffer_num] = self.batch_writer(table_name=table_name, columns=columns, database=database,
+                                                     max_rows=max_rows, max_bytes=max_bytes)
 
     def buffer_insert_value(self, values, buffer_num=0):
-        self.buffers[buffer_num] += make_insert_values_str(values) + ", "
+        self.buffers[buffer_num].add(values)
 
     def buffer_insert_execute(self, run_silent=False, buffer_num=0):
-        self.open_if_closed()
-        self.cursor.execute(self.buffers[buffer_num][:-2] + ";")
-        self.connection.commit()
+        self.buffers[buffer_num].flush()
         if self.verbose and not run_silent:
             print("    Table inserted")
 
-    def insert_spectrum_table(self, table_name, columns, data, database=None):
-        self.creat_table(table_name=table_name,  database=database, dynamic_type='spectrum',
-                         run_silent=True)
-        insert_str = make_insert_many_columns_str(table_name=table_name, columns=columns, database=database)
-        self.cursor.executemany(insert_str, data)
-        self.connection.commit()
+    def insert_spectrum_table(self, table_name, columns, data, database=None, method='executemany',
+                              batch_size=multi_row_batch_size_default, lod_factors=None):
+        # with lod_factors, data must be a format_spectrum array and the level of detail tables
+        # (see mypysql.lod) are made as well
+        if database is None:
+            database = get_login().sql_database
+        with operation_timer(self.instrumentation, 'insert_spectrum_table', rows=len(data)):
+            self.creat_table(table_name=table_name,  database=database, dynamic_type='spectrum',
+                             run_silent=True)
+            self.insert_rows(table_name=table_name, columns=columns, data=data, database=database, method=method,
+                             batch_size=batch_size)
+            self.commit()
+            self.invalidate_cache(table_name=table_name, database=database)
+            if lod_factors:
+                self.insert_lod_tables(table_name=table_name, spectrum=data, database=database,
+                                       lod_factors=lod_factors, method=method, batch_size=batch_size)
+
+    def insert_lod_tables(self, table_name, spectrum, database=None, lod_factors=lod_factors_default,
+                          method='executemany', batch_size=multi_row_batch_size_default):
+        if database is None:
+            database = get_login().sql_database
+        with phase_timer(self.instrumentation, 'format', rows=len(spectrum)):
+            levels = lod_levels(spectrum, lod_factors=lod_factors)
+        for factor, lod in levels.items():
+            lod_name = lod_table_name(table_name, factor)
+            self.drop_if_exists(table_name=lod_name, database=database, run_silent=True)
+            self.cursor.execute(F"CREATE TABLE {database}.`{lod_name}` " + lod_table_spec)
+            self.insert_rows(table_name=lod_name, columns=lod_columns, data=lod, database=database,
+                             method=method, batch_size=batch_size)
+            self.commit()
+            self.invalidate_cache(table_name=lod_name, database=database)
+
+    def insert_rows(self, table_name, columns, data, database=None, method='executemany',
+                    batch_size=multi_row_batch_size_default):
+        # data is a sequence of row tuples or a structured array, method is one of insert_methods.
+        # Nothing is committed here, the caller commits and then calls invalidate_cache.
+        if method not in insert_methods:
+            raise ValueError(F"method must be one of {sorted(insert_methods)}, not: {method}")
+        if database is None:
+            database = get_login().sql_database
+        if method == 'load_data':
+            import mysql.connector
+            try:
+                self.load_data_rows(table_name=table_name, columns=columns, data=data, database=database)
+                return
+            except mysql.connector.Error as err:
+                if err.errno not in load_data_refused_errnos:
+                    raise
+                if self.verbose:
+                    print(F"    LOAD DATA LOCAL INFILE refused ({err.errno}), using multi-row INSERTs instead.")
+            method = 'multi_row'
+        if isinstance(data, ndarray):
+            with phase_timer(self.instrumentation, 'serialize', rows=len(data)):
+                data = spectrum_rows(data)
+        if method == 'executemany':
+            insert_str = make_insert_many_columns_str(table_name=table_name, columns=columns, database=database)
+            with phase_timer(self.instrumentation, 'execute', rows=len(data), statements=1):
+                self.cursor.executemany(insert_str, data)
+        else:
+            for start in range(0, len(data), batch_size):
+                batch = data[start:start + batch_size]
+                insert_str = make_insert_multi_row_str(table_name=table_name, columns=columns,
+                                                       row_count=len(batch), database=database)
+                with phase_timer(self.instrumentation, 'execute', rows=len(batch), statements=1):
+                    self.cursor.execute(insert_str, [value for row in batch for value in row])
+
+    def load_data_rows(self, table_name, columns, data, database=None):
+        if database is None:
+            database = get_login().sql_database
+        with temporary_tsv(data, instrumentation=self.instrumentation) as tsv_path:
+            with phase_timer(self.instrumentation, 'execute', rows=len(data), statements=1):
+                self.cursor.execute(make_load_data_str(table_name=table_name, columns=columns, file_path=tsv_path,
+                                                       database=database))
+
+    def insert_spectrum_table_chunks(self, table_name, chunks, database=None, bandwidth_for_null_um=None,
+                                     bandwidth_fraction_for_null=bandwidth_fraction_for_null_default,
+                                     method='executemany'):
+        if database is None:
+            database = get_login().sql_database
+        self.creat_table(table_name=table_name, database=database, dynamic_type='spectrum', run_silent=True)
+        for spectrum in format_spectrum_chunks(chunks=chunks, bandwidth_for_null_um=bandwidth_for_null_um,
+                                               bandwidth_fraction_for_null=bandwidth_fraction_for_null):
+            self.insert_rows(table_name=table_name, columns=spectrum.dtype.names, data=spectrum,
+                             database=database, method=method)
+        self.commit()
+        self.invalidate_cache(table_name=table_name, database=database)
 
     def creat_database(self, database):
         if self.verbose:
@@ -231,10 +722,136 @@ class OutputSQL:
         self.creat_database(database=database)
 
     def query(self, sql_query_str):
-        self.cursor.execute(sql_query_str)
-        return [item for item in self.cursor]
-
-    def prep_table_ops(self, table, database=sql_database):
+        with operation_timer(self.instrumentation, 'query') as timer:
+            with phase_timer(self.instrumentation, 'execute', statements=1):
+                self.cursor.execute(sql_query_str)
+            with phase_timer(self.instrumentation, 'fetch') as fetch_timer:
+                result = [item for item in self.cursor]
+                fetch_timer.rows = len(result)
+            timer.rows = len(result)
+        return result
+
+    def query_batches(self, sql_query_str, batch_size=query_batch_size_default):
+        # Yields (description, rows) with up to batch_size row tuples at a time from an unbuffered cursor, so the
+        # server streams the result. No other query can run on this connection until the generator is done.
+        self.open_if_closed()
+        cursor = self.connection.cursor(buffered=False)
+        try:
+            with phase_timer(self.instrumentation, 'execute', statements=1):
+                cursor.execute(sql_query_str)
+            with phase_timer(self.instrumentation, 'fetch') as timer:
+                rows = cursor.fetchmany(batch_size)
+                timer.rows = len(rows)
+            # an empty result still gives one (description, []) for the column names
+            yield cursor.description, rows
+            while rows:
+                with phase_timer(self.instrumentation, 'fetch') as timer:
+                    rows = cursor.fetchmany(batch_size)
+                    timer.rows = len(rows)
+                if rows:
+                    yield cursor.description, rows
+        finally:
+            # drop any rows left unread when the caller stops early
+            self.connection.consume_results()
+            cursor.close()
+
+    def query_dataframes(self, sql_query_str, batch_size=query_batch_size_default):
+        import pandas as pd
+        for description, rows in self.query_batches(sql_query_str, batch_size=batch_size):
+            yield pd.DataFrame.from_records(rows, columns=[column[0] for column in description])
+
+    def query_array(self, sql_query_str, dtypes=None, expected_rows=None, batch_size=query_batch_size_default):
+        # the whole result in one structured array (see result_dtype), preallocated with expected_rows
+        # (or one batch) and grown by doubling, so the rows are never held as one list
+        structured_array = None
+        row_count = 0
+        with operation_timer(self.instrumentation, 'query_array') as timer:
+            for description, rows in self.query_batches(sql_query_str, batch_size=batch_size):
+                if structured_array is None:
+                    capacity = max(expected_rows or 0, len(rows))
+                    structured_array = empty(capacity, dtype=result_dtype(description, dtypes=dtypes))
+                elif row_count + len(rows) > len(structured_array):
+                    grown_array = empty(max(2 * len(structured_array), row_count + len(rows)),
+                                        dtype=structured_array.dtype)
+                    grown_array[:row_count] = structured_array[:row_count]
+                    structured_array = grown_array
+                row_count = fill_structured(structured_array, row_count, rows)
+            timer.rows = row_count
+        return structured_array[:row_count]
+
+    def query_spectrum(self, table_name, database=None, batch_size=query_batch_size_default):
+        if database is None:
+            database = get_login().sql_database
+        query_str = F"SELECT `wavelength_um`, `flux`, `flux_error` FROM {database}.`{table_name}` " + \
+                    "ORDER BY `wavelength_um`;"
+        if self.cache is not None:
+            return self.cached_query_array(query_str, table_name=table_name, database=database,
+                                           batch_size=batch_size)
+        return self.query_array(query_str, batch_size=batch_size)
+
+    def query_spectrum_lod(self, table_name, pixels, wavelength_min_um=None, wavelength_max_um=None,
+                           database=None, lod_factors=lod_factors_default, batch_size=query_batch_size_default):
+        # For plotting: returns (factor, lod_dtype array) from the coarsest level of detail table that still has
+        # at least pixels bins in the wavelength window. If none does, the spectrum table itself is read and
+        # returned as factor 1 in the same layout. Levels that were never written (a spectrum written without
+        # lod_factors) are skipped.
+        import mysql.connector
+        if database is None:
+            database = get_login().sql_database
+        window_str = wavelength_window_str(wavelength_min_um=wavelength_min_um, wavelength_max_um=wavelength_max_um)
+        for factor in sorted(lod_factors, reverse=True):
+            lod_name = lod_table_name(table_name, factor)
+            try:
+                bin_count = self.cached_query(F"SELECT COUNT(*) FROM {database}.`{lod_name}`{window_str};",
+                                              table_name=lod_name, database=database)[0][0]
+            except mysql.connector.Error as err:
+                if err.errno != no_such_table_errno:
+                    raise
+                continue
+            if bin_count >= pixels:
+                query_str = F"SELECT {', '.join([F'`{column}`' for column in lod_columns])} " + \
+                            F"FROM {database}.`{lod_name}`{window_str} ORDER BY `wavelength_um`;"
+                return factor, self.cached_query_array(query_str, table_name=lod_name, database=database,
+                                                       dtypes=dict(lod_dtype), expected_rows=bin_count,
+                                                       batch_size=batch_size)
+        query_str = F"SELECT `wavelength_um`, `flux`, `flux_error` FROM {database}.`{table_name}`{window_str} " + \
+                    "ORDER BY `wavelength_um`;"
+        spectrum = self.cached_query_array(query_str, table_name=table_name, database=database,
+                                           batch_size=batch_size)
+        return 1, downsample_spectrum(spectrum, 1)
+
+    def cached_query(self, sql_query_str, table_name, database=None):
+        # query() through the cache, table_name is the table whose writes invalidate this result.
+        # The rows come back as a tuple, shared with every other reader of the cached result.
+        if database is None:
+            database = get_login().sql_database
+        if self.cache is None:
+            return self.query(sql_query_str)
+        cache_key = "query:" + sql_query_str
+        result = self.cache.get(database, table_name, cache_key)
+        if result is None:
+            result = self.cache.put(database, table_name, cache_key, self.query(sql_query_str))
+        return result
+
+    def cached_query_array(self, sql_query_str, table_name, database=None, dtypes=None, expected_rows=None,
+                           batch_size=query_batch_size_default):
+        # query_array() through the cache, the array is read-only as it is shared with every other reader
+        # (with a disk tier it may come back memory-mapped), copy it to change it
+        if database is None:
+            database = get_login().sql_database
+        if self.cache is None:
+            return self.query_array(sql_query_str, dtypes=dtypes, expected_rows=expected_rows, batch_size=batch_size)
+        cache_key = "query_array:" + sql_query_str + (repr(sorted(dtypes.items())) if dtypes else "")
+        result = self.cache.get(database, table_name, cache_key)
+        if result is None:
+            result = self.cache.put(database, table_name, cache_key,
+                                    self.query_array(sql_query_str, dtypes=dtypes, expected_rows=expected_rows,
+                                                     batch_size=batch_size))
+        return result
+
+    def prep_table_ops(self, table, database=None):
+        if database is None:
+            database = get_login().sql_database
         self.cursor.execute(F"""USE {database};""")
         self.cursor.execute(F"""DROP TABLE IF EXISTS `{table}`;""")
 
@@ -0,0 +1,125 @@
+import hashlib
+from collections import namedtuple
+
+import numpy as np
+
+from mypysql.get_login import get_login
+from mypysql.sql import make_insert_many_columns_str, spectrum_rows, fingerprint_table_name
+from mypysql.spectrum import format_spectrum, bandwidth_fraction_for_null_default
+
+
+fingerprint_table_spec = "(`spectrum_table` VARCHAR(200) NOT NULL, " + \
+                         "`block_index` INT NOT NULL, " + \
+                         "`wavelength_min_um` DOUBLE NOT NULL, " + \
+                         "`wavelength_max_um` DOUBLE NOT NULL, " + \
+                         "`row_count` INT NOT NULL, " + \
+                         "`block_hash` CHAR(40) NOT NULL, " + \
+                         "PRIMARY KEY (`spectrum_table`, `block_index`)" + \
+                         ") ENGINE=InnoDB;"
+fingerprint_columns = ['spectrum_table', 'block_index', 'wavelength_min_um', 'wavelength_max_um', 'row_count',
+                       'block_hash']
+sync_block_rows_default = 1000
+
+# a block is (wavelength_min_um, wavelength_max_um, row_count, block_hash), equal blocks hold equal rows
+SyncResult = namedtuple('SyncResult', ['table_name', 'blocks', 'deleted_blocks', 'written_blocks', 'rows_written',
+                                       'full_reload'])
+
+
+def spectrum_blocks(spectrum, block_rows=sync_block_rows_default):
+    # Splits a format_spectrum array into blocks of about block_rows rows and fingerprints each one.
+    # The block boundaries depend only on the wavelength of the row at the boundary (content-defined),
+    # so adding or removing a point only changes the block it falls in, not every block after it.
+    if len(spectrum) == 0:
+        return [], np.array([0])
+    wavelength_bits = spectrum['wavelength_um'].astype(np.float64).view(np.uint64)
+    with np.errstate(over='ignore'):
+        mixed_bits = (wavelength_bits * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)
+    true_is_boundary = (mixed_bits % np.uint64(block_rows)) == 0
+    true_is_boundary[0] = False
+    starts = np.concatenate((np.array([0]), np.flatnonzero(true_is_boundary), np.array([len(spectrum)])))
+    # the bounds are compared to the FLOAT wavelength_um column, so they are the float32 rounded values
+    wavelength_stored = spectrum['wavelength_um'].astype(np.float32).astype(np.float64)
+    blocks = []
+    for start, stop in zip(starts[:-1], starts[1:]):
+        block_hash = hashlib.sha1(spectrum[start:stop].tobytes()).hexdigest()
+        blocks.append((float(wavelength_stored[start]), float(wavelength_stored[stop - 1]), int(stop - start),
+                       block_hash))
+    return blocks, starts
+
+
+def table_exists(output_sql, table_name, database):
+    output_sql.cursor.execute("SELECT COUNT(*) FROM information_schema.tables " +
+                              "WHERE table_schema = %s AND table_name = %s;", (database, table_name))
+    return output_sql.cursor.fetchall()[0][0] > 0
+
+
+def stored_blocks(output_sql, table_name, database):
+    output_sql.cursor.execute(F"CREATE TABLE IF NOT EXISTS {database}.`{fingerprint_table_name}` " +
+                              fingerprint_table_spec)
+    output_sql.cursor.execute("SELECT `wavelength_min_um`, `wavelength_max_um`, `row_count`, `block_hash` " +
+                              F"FROM {database}.`{fingerprint_table_name}` WHERE `spectrum_table` = %s " +
+                              "ORDER BY `block_index`;", (table_name,))
+    return [(float(wavelength_min_um), float(wavelength_max_um), int(row_count), block_hash)
+            for wavelength_min_um, wavelength_max_um, row_count, block_hash in output_sql.cursor.fetchall()]
+
+
+def store_blocks(output_sql, table_name, database, blocks):
+    output_sql.cursor.execute(F"DELETE FROM {database}.`{fingerprint_table_name}` WHERE `spectrum_table` = %s;",
+                              (table_name,))
+    insert_str = make_insert_many_columns_str(table_name=F"`{fingerprint_table_name}`", columns=fingerprint_columns,
+                                              database=database)
+    output_sql.cursor.executemany(insert_str, [(table_name, block_index) + block
+                                               for block_index, block in enumerate(blocks)])
+
+
+def sync_spectrum_table(output_sql, table_name, spectrum, database=None, block_rows=sync_block_rows_default,
+                        method='executemany'):
+    # Brings the spectrum table up to date with a format_spectrum array, writing only the blocks that changed
+    # since the last sync (see spectrum_blocks). Changed ranges are deleted by wavelength_um and the new rows
+    # upserted on the wavelength_um primary key, in one transaction. A table without stored fingerprints
+    # (or that no longer exists) is made and filled the usual way. The other write paths (creat_table,
+    # drop_if_exists, insert_spectrum_table, UploadSQL and publish_schemas) clear the fingerprints of the
+    # tables they replace, so a table rewritten since the last sync is also rewritten in full.
+    if database is None:
+        database = get_login().sql_database
+    output_sql.open_if_closed()
+    blocks, starts = spectrum_blocks(spectrum, block_rows=block_rows)
+    old_blocks = stored_blocks(output_sql, table_name, database)
+    if not old_blocks or not table_exists(output_sql, table_name, database):
+        output_sql.insert_spectrum_table(table_name=table_name, columns=spectrum.dtype.names, data=spectrum,
+                                         database=database, method=method)
+        with output_sql.transaction():
+            store_blocks(output_sql, table_name, database, blocks)
+        return SyncResult(table_name, len(blocks), 0, len(blocks), len(spectrum), True)
+    if old_blocks == blocks:
+        return SyncResult(table_name, len(blocks), 0, 0, 0, False)
+    new_block_set = set(blocks)
+    old_block_set = set(old_blocks)
+    deleted_blocks = [block for block in old_blocks if block not in new_block_set]
+    written_indexes = [i for i, block in enumerate(blocks) if block not in old_block_set]
+    columns = spectrum.dtype.names
+    upsert_str = make_insert_many_columns_str(table_name=table_name, columns=columns, database=database) + \
+        " ON DUPLICATE KEY UPDATE " + \
+        ", ".join([F"`{column_name}` = VALUES(`{column_name}`)" for column_name in columns[1:]])
+    rows_written = 0
+    with output_sql.transaction():
+        for wavelength_min_um, wavelength_max_um, row_count, block_hash in deleted_blocks:
+            output_sql.cursor.execute(F"DELETE FROM {database}.{table_name} " +
+                                      "WHERE `wavelength_um` BETWEEN %s AND %s;",
+                                      (wavelength_min_um, wavelength_max_um))
+        for i in written_indexes:
+            rows = spectrum_rows(spectrum[starts[i]:starts[i + 1]])
+            output_sql.cursor.executemany(upsert_str, rows)
+            rows_written += len(rows)
+        store_blocks(output_sql, table_name, database, blocks)
+    output_sql.invalidate_cache(table_name=table_name, database=database)
+    return SyncResult(table_name, len(blocks), len(deleted_blocks), len(written_indexes), rows_written, False)
+
+
+def sync_spectrum(output_sql, table_name, wavelength_um, flux, flux_error=None, database=None,
+                  bandwidth_fraction_for_null=bandwidth_fraction_for_null_default, block_rows=sync_block_rows_default,
+                  method='executemany'):
+    spectrum = format_spectrum(wavelength_um=wavelength_um, flux=flux, flux_error=flux_error,
+                               bandwidth_fraction_for_null=bandwidth_fraction_for_null, vectorized=True)
+    return sync_spectrum_table(output_sql=output_sql, table_name=table_name, spectrum=spectrum, database=database,
+                               block_rows=block_rows, method=method)
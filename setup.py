@@ -13,4 +13,5 @@ setup(name='mypysql',
                         'pymysql',
                         'pandas',
                         'sqlalchemy',
-                        'Unidecode'])
+                        'Unidecode'],
+      extras_require={'async': ['aiomysql']})
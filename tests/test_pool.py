@@ -0,0 +1,114 @@
+import gc
+import threading
+
+import pytest
+
+pytest.importorskip("mysql.connector")
+
+from mypysql.get_login import set_login, reset_login
+from mypysql.pool import ConnectionPool
+
+
+class FakeConnection:
+    # the parts of a mysql.connector connection that the pool uses, USE is tracked through database
+    def __init__(self, database=None, **kwargs):
+        self.database = database
+        self.rollbacks = 0
+        self.resets = 0
+        self.closed = False
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def reset_session(self):
+        self.resets += 1
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def login():
+    set_login(sql_database='pool_default', sql_user='user', sql_password='password')
+    yield
+    reset_login()
+
+
+def test_connections_are_reused():
+    pool = ConnectionPool(size=2, connect=FakeConnection)
+    for _ in range(5):
+        connection = pool.checkout()
+        connection.close()
+    stats = pool.stats()
+    assert stats['checkouts'] == 5
+    assert stats['creations'] == 1
+    assert stats['reset_failures'] == 0
+
+
+def test_release_rolls_back_and_switches_back_to_the_default_database():
+    pool = ConnectionPool(size=1, connect=FakeConnection)
+    connection = pool.checkout()
+    raw_connection = connection._connection
+    # what a USE statement leaves behind
+    connection.database = 'other_database'
+    connection.close()
+    assert raw_connection.rollbacks == 1
+    assert raw_connection.resets == 1
+    assert raw_connection.database == 'pool_default'
+    assert not raw_connection.closed
+    assert pool.stats()['creations'] == 1
+
+
+def test_checkout_waits_for_a_returned_connection():
+    pool = ConnectionPool(size=1, timeout_s=5.0, connect=FakeConnection)
+    connection = pool.checkout()
+    timer = threading.Timer(0.05, connection.close)
+    timer.start()
+    second_connection = pool.checkout()
+    second_connection.close()
+    timer.join()
+    stats = pool.stats()
+    assert stats['waits'] == 1
+    assert stats['creations'] == 1
+
+
+def test_checkout_times_out_when_the_pool_is_empty():
+    pool = ConnectionPool(size=1, timeout_s=0.01, connect=FakeConnection)
+    connection = pool.checkout()
+    with pytest.raises(TimeoutError):
+        pool.checkout()
+    connection.close()
+
+
+def test_idle_connections_are_recycled():
+    pool = ConnectionPool(size=1, recycle_s=0.0, connect=FakeConnection)
+    connection = pool.checkout()
+    raw_connection = connection._connection
+    connection.close()
+    pool.checkout().close()
+    stats = pool.stats()
+    assert raw_connection.closed
+    assert stats['recycles'] == 1
+    assert stats['creations'] == 2
+    assert stats['open'] == 1
+
+
+def test_unclosed_connection_is_returned_when_collected():
+    pool = ConnectionPool(size=1, timeout_s=0.01, connect=FakeConnection)
+    connection = pool.checkout()
+    del connection
+    gc.collect()
+    assert pool.stats()['idle'] == 1
+    pool.checkout().close()
+    assert pool.stats()['creations'] == 1
+
+
+def test_close_releases_once():
+    pool = ConnectionPool(size=1, connect=FakeConnection)
+    connection = pool.checkout()
+    connection.close()
+    connection.close()
+    assert pool.stats()['idle'] == 1
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from mypysql.get_login import set_login, reset_login, login_env_vars
+from mypysql.publish import publish_schema, publish_schemas
+
+
+# These run against a MySQL server given by the MYPYSQL_* environment variables (see mypysql.get_login),
+# the user needs to create and drop databases. Without a server they are skipped.
+test_databases = ['mypysql_test_live', 'mypysql_test_staging', 'mypysql_test_live_old',
+                  'mypysql_test_live2', 'mypysql_test_staging2', 'mypysql_test_live2_old']
+
+
+@pytest.fixture
+def output_sql():
+    mysql_connector = pytest.importorskip("mysql.connector")
+    if not all(login_env_vars[field] in os.environ for field in ('sql_user', 'sql_password')):
+        pytest.skip("no MySQL server, set MYPYSQL_USER and MYPYSQL_PASSWORD (and MYPYSQL_HOST, MYPYSQL_PORT)")
+    set_login(sql_database='mypysql_test_live', sql_user=os.environ['MYPYSQL_USER'],
+              sql_password=os.environ['MYPYSQL_PASSWORD'], sql_host=os.environ.get('MYPYSQL_HOST', 'localhost'),
+              sql_port=int(os.environ.get('MYPYSQL_PORT', 3306)))
+    from mypysql.sql import OutputSQL
+    try:
+        output_sql = OutputSQL(verbose=False)
+    except mysql_connector.Error as err:
+        reset_login()
+        pytest.skip(F"no MySQL server: {err}")
+    for database in test_databases:
+        output_sql.drop_database(database)
+    yield output_sql
+    for database in test_databases:
+        output_sql.drop_database(database)
+    output_sql.close()
+    reset_login()
+
+
+def make_table(output_sql, database, values):
+    output_sql.clear_database(database)
+    output_sql.cursor.execute(F"CREATE TABLE `{database}`.`params` (`value` INT NOT NULL PRIMARY KEY);")
+    output_sql.cursor.executemany(F"INSERT INTO `{database}`.`params` (`value`) VALUES (%s);",
+                                  [(value,) for value in values])
+    output_sql.connection.commit()
+
+
+def table_values(output_sql, database):
+    return sorted(value for value, in output_sql.query(F"SELECT `value` FROM `{database}`.`params`;"))
+
+
+def test_publish_schema_swaps_staging_into_live(output_sql):
+    make_table(output_sql, 'mypysql_test_live', [1, 2])
+    make_table(output_sql, 'mypysql_test_staging', [10, 20, 30])
+    publish_schema(output_sql, staging='mypysql_test_staging', live='mypysql_test_live',
+                   expected_counts={'params': 3})
+    assert table_values(output_sql, 'mypysql_test_live') == [10, 20, 30]
+    assert table_values(output_sql, 'mypysql_test_live_old') == [1, 2]
+    assert 'params' not in [table_name for table_name, in output_sql.get_tables('mypysql_test_staging')]
+
+
+def test_publish_schemas_changes_nothing_when_a_pair_fails(output_sql):
+    make_table(output_sql, 'mypysql_test_live', [1, 2])
+    make_table(output_sql, 'mypysql_test_staging', [10, 20, 30])
+    make_table(output_sql, 'mypysql_test_live2', [3])
+    make_table(output_sql, 'mypysql_test_staging2', [40])
+    # the rollback copy of an earlier publish, it must survive the failed one
+    make_table(output_sql, 'mypysql_test_live_old', [0])
+    with pytest.raises(ValueError):
+        publish_schemas(output_sql, schema_map=[('mypysql_test_live', 'mypysql_test_staging'),
+                                                ('mypysql_test_live2', 'mypysql_test_staging2')],
+                        expected_counts={'mypysql_test_live': {'params': 3}, 'mypysql_test_live2': {'params': 2}})
+    assert table_values(output_sql, 'mypysql_test_live') == [1, 2]
+    assert table_values(output_sql, 'mypysql_test_live2') == [3]
+    assert table_values(output_sql, 'mypysql_test_live_old') == [0]
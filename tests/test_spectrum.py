@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from mypysql.spectrum import format_spectrum, format_spectrum_chunks, spectrum_chunks
+
+
+def make_spectrum(seed, n_points=200, dtype=np.float64):
+    # increasing wavelengths with gaps and isolated points, bad flux and flux_error values
+    rng = np.random.default_rng(seed)
+    steps = rng.uniform(0.5, 1.5, n_points)
+    gap_indexes = rng.choice(n_points, size=6, replace=False)
+    steps[gap_indexes] += rng.uniform(5.0, 50.0, len(gap_indexes))
+    wavelength_um = np.cumsum(steps).astype(dtype)
+    flux = rng.normal(1.0, 0.1, n_points).astype(dtype)
+    flux[rng.choice(n_points, size=5, replace=False)] = np.nan
+    flux[rng.choice(n_points, size=2, replace=False)] = np.inf
+    flux_error = rng.uniform(0.01, 0.1, n_points).astype(dtype)
+    flux_error[rng.choice(n_points, size=5, replace=False)] = np.nan
+    return wavelength_um, flux, flux_error
+
+
+cases = [(seed, dtype, has_error) for seed in range(5) for dtype in (np.float64, np.float32)
+         for has_error in (True, False)]
+
+
+@pytest.mark.parametrize("seed, dtype, has_error", cases)
+def test_vectorized_is_byte_identical_to_the_loop(seed, dtype, has_error):
+    wavelength_um, flux, flux_error = make_spectrum(seed, dtype=dtype)
+    if not has_error:
+        flux_error = None
+    loop_spectrum = format_spectrum(wavelength_um, flux, flux_error, vectorized=False)
+    vector_spectrum = format_spectrum(wavelength_um, flux, flux_error, vectorized=True)
+    assert vector_spectrum.dtype == loop_spectrum.dtype
+    assert vector_spectrum.tobytes() == loop_spectrum.tobytes()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 17, 1000])
+@pytest.mark.parametrize("seed, dtype, has_error", cases)
+def test_chunks_concatenate_to_the_loop(seed, dtype, has_error, chunk_size):
+    wavelength_um, flux, flux_error = make_spectrum(seed, dtype=dtype)
+    if not has_error:
+        flux_error = None
+    loop_spectrum = format_spectrum(wavelength_um, flux, flux_error, vectorized=False)
+    chunked = list(format_spectrum_chunks(spectrum_chunks(wavelength_um, flux, flux_error, chunk_size=chunk_size)))
+    chunked_spectrum = np.concatenate(chunked)
+    assert chunked_spectrum.dtype == loop_spectrum.dtype
+    assert chunked_spectrum.tobytes() == loop_spectrum.tobytes()